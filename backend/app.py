@@ -1,26 +1,41 @@
 # Standard library imports
 import os
 import re
+import json
 import uuid
+import hashlib
+import time
 import logging
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, List
 
 # Third-party imports
-from flask import Flask, request, jsonify, session, Response
+from flask import Flask, request, jsonify, session, Response, g, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import chromadb
 import pypdf
 from sentence_transformers import SentenceTransformer
 from unidecode import unidecode
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
 import pytesseract
 import pandas as pd
 import requests
 from groq import Groq
 import ollama
 
+# Local imports
+from history_log import HistoryLog
+from collection_maintenance import LEGAL_COLLECTION_NAME, CHAT_COLLECTION_NAME, DOCUMENT_COLLECTION_NAME
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from upload_spool import SpoolingRequest, InFlightLimiter, spooled_path, open_mmap, file_sha256
+from embedding_snapshot import load_snapshot
+from extractive_summarizer import ExtractiveSummarizer, strip_footnote_markers, strip_repeated_lines
+from prompt_builder import (
+    count_tokens, PromptBuilder, PRIORITY_SYSTEM, PRIORITY_QUESTION, PRIORITY_CONTEXT, PRIORITY_HISTORY
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -30,19 +45,49 @@ logger = logging.getLogger(__name__)
 
 # Flask app configuration
 app = Flask(__name__)
+app.request_class = SpoolingRequest  # uploads stream to temp files, not memory
 CORS(app)
-app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
 app.secret_key = os.urandom(24)
 
 # Constants
 UPLOAD_FOLDER = "uploads"
-HISTORY_FILE = "chat_history.txt"
+HISTORY_DIR = "chat_history"
+HISTORY_MESSAGES = 5
+QUERY_PROMPT_TOKENS = int(os.environ.get("QUERY_PROMPT_TOKENS", 3000))
+UPLOAD_PROMPT_TOKENS = int(os.environ.get("UPLOAD_PROMPT_TOKENS", 2500))
+HISTORY_MESSAGE_TOKENS = int(os.environ.get("HISTORY_MESSAGE_TOKENS", 300))
+UPLOAD_ENDPOINTS = {"upload_pdf", "ingest_text"}
+CHUNK_WORDS = 200
+CHUNK_OVERLAP_WORDS = 40
+DOCUMENT_CONTEXT_CHUNKS = 4  # chunks of the session's uploaded document added to /query prompts
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", 200))
+BATCH_MAX_PARALLEL = int(os.environ.get("BATCH_MAX_PARALLEL", 8))
+SNAPSHOT_EXACT_MAX_ROWS = int(os.environ.get("SNAPSHOT_EXACT_MAX_ROWS", 20000))
+EXTRACT_TARGET_TOKENS = int(os.environ.get("EXTRACT_TARGET_TOKENS", 1200))
+PASTED_DOCUMENT_TOKENS = 1000  # a separator-less question longer than this is treated as a document
+PASTED_CONTEXT_SEPARATOR = "\n\nContext:\n"  # how Chatbot.jsx appends extracted file text
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+UPLOAD_INFLIGHT_MAX_BYTES = int(os.environ.get("UPLOAD_INFLIGHT_MAX_BYTES", 200 * 1024 * 1024))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+history_log = HistoryLog(HISTORY_DIR)
+upload_limiter = InFlightLimiter(UPLOAD_INFLIGHT_MAX_BYTES)
 
 # Initialize services
+# The snapshot is memory-mapped, so it is shared by all workers and loads instantly
+embedding_snapshot = load_snapshot()
+collection = None
 try:
     client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_or_create_collection(name="legal_docs")
+    collection = client.get_or_create_collection(name=LEGAL_COLLECTION_NAME)
+    # Chat turns are kept apart so they don't grow the curated corpus index
+    chat_collection = client.get_or_create_collection(name=CHAT_COLLECTION_NAME)
+    document_collection = client.get_or_create_collection(name=DOCUMENT_COLLECTION_NAME)
+    logger.info("ChromaDB initialized successfully.")
+except Exception as e:
+    logger.error(f"Error initializing ChromaDB: {e}")
+
+try:
     model_embedding = SentenceTransformer("all-MiniLM-L6-v2")
     ollama.pull("llama3")
     logger.info("Services initialized successfully.")
@@ -52,32 +97,59 @@ except Exception as e:
 # Utility functions
 def clean_ocr_text(text: str) -> str:
     text = unidecode(text)
+    text = strip_footnote_markers(text)  # e.g. 2*[India] -> India
     text = re.sub(r'Pennit', 'Permit', text)
     text = re.sub(r'\s+', ' ', text)
     text = re.sub(r'[^a-zA-Z0-9\s.,:/()-]', '', text)
     return text.strip()
 
-def extract_text_from_pdf(file) -> Optional[str]:
+def extract_text_from_pdf(path: str) -> Optional[str]:
+    """Extract text from a PDF on disk, falling back to OCR for scanned files"""
     try:
-        pdf_reader = pypdf.PdfReader(file)
-        text = "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-        if not text:
-            images = convert_from_bytes(file.read())
-            text = "\n".join([pytesseract.image_to_string(img) for img in images])
-        return clean_ocr_text(text)
+        # The memory map lets pypdf read pages on demand instead of copying the file
+        with open_mmap(path) as pdf_data:
+            pdf_reader = pypdf.PdfReader(pdf_data)
+            page_count = len(pdf_reader.pages)
+            page_texts = [page_text for page_text in (page.extract_text() for page in pdf_reader.pages) if page_text]
+        if not page_texts:
+            ocr_pages = ocr_pdf_pages(path, range(1, page_count + 1))
+            page_texts = [ocr_pages[n] for n in sorted(ocr_pages)]
+        # Running headers are only recognizable while line and page breaks survive
+        return clean_ocr_text("\n".join(strip_repeated_lines(page_texts)))
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         return None
 
+def ocr_pdf_pages(path: str, page_numbers) -> Dict[int, str]:
+    """OCR selected 1-based pages of a PDF on disk"""
+    texts = {}
+    # pdftoppm reads the file by path; rasterize one page at a time to bound memory
+    for page_number in page_numbers:
+        images = convert_from_path(path, first_page=page_number, last_page=page_number)
+        texts[page_number] = "\n".join(pytesseract.image_to_string(img) for img in images)
+    return texts
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP_WORDS) -> List[str]:
+    """Split text into overlapping word windows for indexing"""
+    words = text.split()
+    step = max(1, chunk_words - overlap)
+    return [
+        " ".join(words[start:start + chunk_words])
+        for start in range(0, max(len(words) - overlap, 1), step)
+        if words[start:start + chunk_words]
+    ]
+
 def load_history():
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r") as f:
-            return f.read().split("\n")[-5:]  # Load last 5 messages
-    return []
+    # Each record holds one exchange (two messages), so only the tail of the log is read
+    records = history_log.tail((HISTORY_MESSAGES + 1) // 2)
+    messages = []
+    for record in records:
+        messages.append(f"User: {record['user']}")
+        messages.append(f"AI: {record['ai']}")
+    return messages[-HISTORY_MESSAGES:]  # Load last 5 messages
 
 def save_history(user_input, bot_response):
-    with open(HISTORY_FILE, "a") as f:
-        f.write(f"User: {user_input}\nAI: {bot_response}\n")
+    history_log.append({"user": user_input, "ai": bot_response})
 
 def generate_response(user_input):
     chat_history = load_history()
@@ -107,52 +179,74 @@ def should_use_local_model(prompt: str) -> bool:
     ]
     return any(file_related_indicators)
 
-def stream_llama_response(prompt: str) -> str:
+SYSTEM_PROMPT = (
+    "You are an AI legal assistant. Provide direct, declarative responses without "
+    "asking questions back. Be professional yet conversational, and focus on "
+    "providing clear, actionable information."
+)
+
+def generate_local(prompt: str) -> str:
+    logger.info("Using local LLaMA model")
+    response = requests.post(
+        "http://127.0.0.1:11434/api/generate",
+        json={
+            "model": "llama3",
+            "prompt": f"{SYSTEM_PROMPT}\n\n{prompt}",
+            "stream": False,
+            "max_tokens": 2048,
+            "temperature": 0.7
+        }
+    )
+    if response.status_code == 200:
+        return response.json().get("response", "Error processing with local model")
+    else:
+        logger.error(f"Error with local LLaMA: {response.text}")
+        return "Error processing with local model"
+
+def generate_groq(prompt: str) -> str:
+    logger.info("Using Groq API")
+    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+    chat_completion = client.chat.completions.create(
+        messages=[
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model="llama-3.3-70b-versatile",
+    )
+    return chat_completion.choices[0].message.content
+
+def parse_spillover_targets(value: str) -> Dict[str, str]:
+    """Parse "local:remote,remote:local" into {"local": "remote", "remote": "local"}"""
+    targets = {}
+    for pair in value.split(","):
+        if ":" in pair:
+            source, target = pair.split(":", 1)
+            targets[source.strip()] = target.strip()
+    return targets
+
+llm_scheduler = LLMScheduler(
+    backends={"local": generate_local, "remote": generate_groq},
+    concurrency={
+        "local": int(os.environ.get("LOCAL_LLM_CONCURRENCY", 1)),
+        "remote": int(os.environ.get("REMOTE_LLM_CONCURRENCY", 8)),
+    },
+    spillover_after=float(os.environ.get("LLM_SPILLOVER_SECONDS", 5)),
+    spillover_targets=parse_spillover_targets(os.environ.get("LLM_SPILLOVER_TARGETS", "local:remote,remote:local")),
+)
+
+def stream_llama_response(prompt: str, priority: int = PRIORITY_INTERACTIVE,
+                          allow_spillover: bool = True) -> str:
     try:
-        if should_use_local_model(prompt):
-            logger.info("Using local LLaMA model for file processing")
-            response = requests.post(
-                "http://127.0.0.1:11434/api/generate",
-                json={
-                    "model": "llama3",
-                    "prompt": (
-                        "You are an AI legal assistant. Provide direct, declarative responses without "
-                        "asking questions back. Be professional yet conversational, and focus on "
-                        "providing clear, actionable information.\n\n"
-                        f"{prompt}"
-                    ),
-                    "stream": False,
-                    "max_tokens": 2048,
-                    "temperature": 0.7
-                }
-            )
-            if response.status_code == 200:
-                return response.json().get("response", "Error processing with local model")
-            else:
-                logger.error(f"Error with local LLaMA: {response.text}")
-                return "Error processing with local model"
-        
-        else:
-            logger.info("Using Groq API for general query")
-            client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an AI legal assistant. Provide direct, declarative responses "
-                            "without asking questions back. Be professional yet conversational, and "
-                            "focus on providing clear, actionable information."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="llama-3.3-70b-versatile",
-            )
-            return chat_completion.choices[0].message.content
+        # File processing prefers the local model, general queries prefer Groq;
+        # the scheduler may move a job to the other backend when its queue is backed up
+        backend = "local" if should_use_local_model(prompt) else "remote"
+        return llm_scheduler.generate(prompt, backend, priority, allow_spillover)
 
     except Exception as e:
         logger.error(f"Error in stream_llama_response: {e}")
@@ -160,9 +254,14 @@ def stream_llama_response(prompt: str) -> str:
 
 def store_chat_history(session_id, user_question, full_response):
     try:
-        doc_entry = {"question": user_question, "answer": full_response}
+        doc_entry = {
+            "question": user_question,
+            "answer": full_response,
+            "session_id": session_id or "",
+            "created_at": time.time()
+        }
         doc_id = str(uuid.uuid4())  # Ensure unique ID for each entry
-        collection.add(
+        chat_collection.add(
             ids=[doc_id],
             metadatas=[doc_entry],  # Ensure this is a list
             documents=[full_response]  # Ensure this is a list
@@ -171,14 +270,84 @@ def store_chat_history(session_id, user_question, full_response):
     except Exception as e:
         logger.error(f"Error storing chat history: {e}")
 
+def snapshot_is_current() -> bool:
+    """True if the snapshot was exported from the collection as it is now"""
+    if embedding_snapshot is None or collection is None:
+        return False
+    try:
+        return embedding_snapshot.manifest.get("rows") == collection.count()
+    except Exception as e:
+        logger.error(f"Error checking embedding snapshot freshness: {e}")
+        return False
+
+def search_legal_corpus(query: str, n_results: int = 5, query_embedding=None) -> List[Dict]:
+    """Metadata of the curated entries most relevant to the query.
+
+    Small corpora are searched exactly in the memory-mapped snapshot as long
+    as it matches Chroma's row count, so a fresh init_db.py load is never
+    ignored; larger or changed ones go to Chroma, with the snapshot as
+    fallback if Chroma is unavailable. Pass query_embedding when the query has
+    already been encoded to skip embedding it again.
+    """
+    use_snapshot = embedding_snapshot is not None and (
+        collection is None
+        or (len(embedding_snapshot) <= SNAPSHOT_EXACT_MAX_ROWS and snapshot_is_current())
+    )
+    if not use_snapshot:
+        try:
+            if query_embedding is not None:
+                results = collection.query(query_embeddings=[list(query_embedding)], n_results=n_results)
+            else:
+                results = collection.query(query_texts=[query], n_results=n_results)
+            return [doc for doc in results["metadatas"][0] if isinstance(doc, dict)]
+        except Exception as e:
+            if embedding_snapshot is None:
+                raise
+            logger.error(f"Chroma query failed, using embedding snapshot: {e}")
+    if query_embedding is None:
+        query_embedding = model_embedding.encode([query])[0]
+    return [entry["metadata"] for entry in embedding_snapshot.search(query_embedding, n_results)]
+
+def retrieve_legal_context(query: str, n_results: int = 5, query_embedding=None) -> List[str]:
+    """Texts of the curated entries most relevant to the query, for the prompt"""
+    try:
+        results = search_legal_corpus(query, n_results, query_embedding)
+        return [doc["text"] for doc in results if doc.get("text")]
+    except Exception as e:
+        logger.error(f"Error retrieving legal context: {e}")
+        return []
+
+def retrieve_document_context(query: str, document_key: Optional[str],
+                              n_results: int = DOCUMENT_CONTEXT_CHUNKS, query_embedding=None) -> List[str]:
+    """Chunks of an indexed upload most relevant to the query, for the prompt"""
+    if not document_key:
+        return []
+    try:
+        if query_embedding is None:
+            query_embedding = model_embedding.encode([query])[0]
+        results = document_collection.query(
+            query_embeddings=[list(query_embedding)],
+            n_results=n_results,
+            where={"document_key": document_key}
+        )
+        return [doc for doc in results["documents"][0] if doc]
+    except Exception as e:
+        logger.error(f"Error retrieving document context: {e}")
+        return []
+
+def encode_query(query: str):
+    """Embedding of a query, or None (callers then embed on their own) if the model is unavailable"""
+    try:
+        return model_embedding.encode([query])[0]
+    except Exception as e:
+        logger.error(f"Error embedding query: {e}")
+        return None
+
 def retrieve_chat_history(session_id, query):
     """Retrieves past chat history relevant to the new query"""
     try:
-        results = collection.query(
-            query_texts=[query],
-            n_results=5
-        )
-        past_messages = [doc["text"] for doc in results["metadatas"][0] if isinstance(doc, dict) and "text" in doc]
+        results = search_legal_corpus(query, n_results=5)
+        past_messages = [doc["text"] for doc in results if "text" in doc]
         return "\n".join(past_messages) if past_messages else ""
     except Exception as e:
         logger.error(f"Error retrieving chat history: {e}")
@@ -192,11 +361,12 @@ def save_chat_message(session_id: str, role: str, content: str) -> bool:
             "session_id": session_id,
             "role": role,
             "timestamp": str(datetime.datetime.now()),
+            "created_at": time.time(),
             "content": content
         }
         
         # Store in ChromaDB
-        collection.add(
+        chat_collection.add(
             ids=[message_id],
             documents=[content],
             metadatas=[metadata]
@@ -207,10 +377,38 @@ def save_chat_message(session_id: str, role: str, content: str) -> bool:
         logger.error(f"Error saving chat message: {e}")
         return False
 
+def save_chat_messages(session_id: str, messages: List[tuple], embeddings: Optional[List] = None) -> bool:
+    """Store several (role, content) messages in one ChromaDB write"""
+    if not messages:
+        return True
+    try:
+        now = time.time()
+        metadatas = [
+            {
+                "session_id": session_id,
+                "role": role,
+                "timestamp": str(datetime.datetime.now()),
+                "created_at": now,
+                "content": content
+            }
+            for role, content in messages
+        ]
+        chat_collection.add(
+            ids=[str(uuid.uuid4()) for _ in messages],
+            documents=[content for _, content in messages],
+            metadatas=metadatas,
+            embeddings=embeddings
+        )
+        logger.info(f"Saved {len(messages)} chat messages for session {session_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Error saving chat messages: {e}")
+        return False
+
 def get_chat_history(session_id, limit=10):
     try:
         # Query ChromaDB for messages from this session
-        results = collection.query(
+        results = chat_collection.query(
             query_texts=[f"session:{session_id}"],
             where={"session_id": session_id},
             n_results=limit
@@ -266,6 +464,189 @@ def format_response(text: str) -> str:
         logger.error(f"Error formatting response: {e}")
         return text
 
+def presummarize(text: str, question: Optional[str] = None) -> str:
+    """Shrink a document to its most relevant sentences before it reaches the LLM"""
+    try:
+        extract, stats = ExtractiveSummarizer(model_embedding, EXTRACT_TARGET_TOKENS).summarize(text, question)
+        logger.info(f"Extractive pre-summary: {stats}")
+        return extract
+    except Exception as e:
+        logger.error(f"Error pre-summarizing document: {e}")
+        return text
+
+def split_pasted_document(user_question: str):
+    """Separate a pasted document from the question; returns (question, document or None)"""
+    if PASTED_CONTEXT_SEPARATOR in user_question:
+        question, document = user_question.split(PASTED_CONTEXT_SEPARATOR, 1)
+        return question.strip(), clean_ocr_text(document)
+    if count_tokens(user_question) > PASTED_DOCUMENT_TOKENS:
+        return "", clean_ocr_text(user_question)
+    return user_question, None
+
+def build_query_prompt(user_question: str, chat_history: List[Dict],
+                       context_chunks: Optional[List[str]] = None,
+                       context_header: str = "### Relevant Context:",
+                       document_chunks: Optional[List[str]] = None) -> str:
+    """Assemble the /query prompt within QUERY_PROMPT_TOKENS"""
+    builder = PromptBuilder(QUERY_PROMPT_TOKENS)
+    builder.add_text(
+        "system",
+        "You are an AI legal assistant. Answer professionally while keeping a conversational tone.",
+        PRIORITY_SYSTEM
+    )
+    builder.add_items("document", document_chunks or [], PRIORITY_CONTEXT, header="### Document Context:")
+    builder.add_items("context", context_chunks or [], PRIORITY_CONTEXT, header=context_header)
+    builder.add_items(
+        "history",
+        [f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history],
+        PRIORITY_HISTORY,
+        header="### Chat History:",
+        prefer_recent=True,
+        max_item_tokens=HISTORY_MESSAGE_TOKENS
+    )
+    builder.add_text("question", user_question, PRIORITY_QUESTION, header="### Current Question:")
+    prompt, report = builder.build()
+    logger.info(f"Query prompt tokens: {report}")
+    return prompt
+
+def build_upload_prompt(filename: str, text: str) -> str:
+    """Assemble the document summary prompt within UPLOAD_PROMPT_TOKENS"""
+    builder = PromptBuilder(UPLOAD_PROMPT_TOKENS)
+    builder.add_text(
+        "system",
+        "You are an AI legal assistant processing an uploaded document. "
+        "Answer professionally while keeping a conversational tone.\n\n"
+        f"### File uploaded: {filename}",
+        PRIORITY_SYSTEM
+    )
+    builder.add_text("document", text, PRIORITY_CONTEXT, header="### Document Context:")
+    builder.add_text(
+        "question",
+        "Please analyze this legal document and provide a comprehensive summary.",
+        PRIORITY_QUESTION
+    )
+    prompt, report = builder.build()
+    logger.info(f"Upload prompt tokens: {report}")
+    return prompt
+
+def index_document(document_key: str, filename: str, text: str) -> int:
+    """Chunk, embed and index a document; re-indexing the same key overwrites it"""
+    chunks = chunk_text(text)
+    if not chunks:
+        return 0
+    embeddings = model_embedding.encode(chunks).tolist()
+    document_collection.upsert(
+        ids=[f"{document_key}-{i}" for i in range(len(chunks))],
+        embeddings=embeddings,
+        documents=chunks,
+        metadatas=[
+            {"document_key": document_key, "filename": filename, "chunk": i, "created_at": time.time()}
+            for i in range(len(chunks))
+        ]
+    )
+    return len(chunks)
+
+def is_document_indexed(document_key: str) -> bool:
+    try:
+        return bool(document_collection.get(where={"document_key": document_key}, limit=1)["ids"])
+    except Exception as e:
+        logger.error(f"Error checking document index: {e}")
+        return True  # don't re-embed on a lookup failure
+
+def load_processed_document(document_key: str) -> Optional[Dict]:
+    """Earlier processing result for a document key, if any"""
+    result_path = os.path.join(UPLOAD_FOLDER, f"{document_key}.json")
+    if not os.path.exists(result_path):
+        return None
+    with open(result_path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    logger.info(f"Reusing processed document {document_key}")
+    session["pdf_file_path"] = result["file_path"]
+    session["document_key"] = document_key
+    session.setdefault("chat_history", [])
+    return result
+
+def process_document(filename: str, text: str, document_hash: str, verified: bool) -> Dict:
+    """Index and summarize cleaned document text, reusing earlier results.
+
+    Results are keyed by the file hash only when the server has checked it
+    against the file; otherwise by a hash of the text itself, so a client
+    claiming someone else's document_hash cannot overwrite their results.
+    """
+    if verified:
+        document_key = document_hash
+    else:
+        document_key = "text-" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    result = load_processed_document(document_key)
+    if result is not None:
+        # Chunks may have expired under collection_maintenance.py retention
+        if not is_document_indexed(document_key):
+            index_document(document_key, filename, text)
+        return result
+
+    chunks = index_document(document_key, filename, text)
+
+    # Make it explicit that we're using local model for file processing;
+    # the full text is indexed above, only the extract goes into the prompt
+    prompt = build_upload_prompt(filename, presummarize(text))
+
+    # This will automatically use local LLaMA due to should_use_local_model check;
+    # summaries queue behind interactive chat
+    response = stream_llama_response(prompt, priority=PRIORITY_BULK)
+
+    # Split the text into lines and get the first line as the query
+    lines = text.split('\n')
+    query = lines[0].strip()
+    remaining_text = '\n'.join(lines[1:])
+
+    file_id = str(uuid.uuid4())
+    file_path = os.path.join(UPLOAD_FOLDER, f"{file_id}.txt")
+
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(remaining_text)
+
+    session["pdf_file_path"] = file_path
+    session["document_key"] = document_key
+    session.setdefault("chat_history", [])
+
+    result = {
+        "file_id": file_id,
+        "file_path": file_path,
+        "document_hash": document_hash,
+        "chunks": chunks,
+        "query": query,
+        "response": response
+    }
+    # Error responses from the model are not cached so a retry regenerates them
+    if not response.startswith("Error processing"):
+        result_path = os.path.join(UPLOAD_FOLDER, f"{document_key}.json")
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+    return result
+
+# Request hooks
+@app.before_request
+def reserve_upload_bytes():
+    """Reject uploads that would push total in-flight upload bytes over the cap"""
+    if request.endpoint not in UPLOAD_ENDPOINTS:
+        return None
+    max_bytes = app.config["MAX_CONTENT_LENGTH"]
+    # Chunked uploads declare no length; reserve the per-request maximum for them
+    nbytes = request.content_length if request.content_length is not None else max_bytes
+    if nbytes > max_bytes:
+        return jsonify({"error": "File too large."}), 413
+    if not upload_limiter.try_acquire(nbytes):
+        logger.warning(f"Rejecting upload of {nbytes} bytes: {upload_limiter.in_flight} bytes in flight")
+        return jsonify({"error": "Server busy processing uploads, please retry shortly."}), 503, {"Retry-After": "5"}
+    g.upload_reserved_bytes = nbytes
+    return None
+
+@app.teardown_request
+def release_upload_bytes(exc):
+    nbytes = g.pop("upload_reserved_bytes", None)
+    if nbytes:
+        upload_limiter.release(nbytes)
+
 # Route handlers
 @app.route("/upload", methods=["POST"])
 def upload_pdf():
@@ -277,46 +658,103 @@ def upload_pdf():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        text = extract_text_from_pdf(file)
-        if not text:
-            return jsonify({"error": "Failed to extract text from the file."}), 400
-
-        # Make it explicit that we're using local model for file processing
-        prompt = (
-            "You are an AI legal assistant processing an uploaded document. "
-            "Answer professionally while keeping a conversational tone.\n\n"
-            f"### File uploaded: {file.filename}\n"
-            f"### Document Context:\n{text[:1500]}...\n\n"
-            "Please analyze this legal document and provide a comprehensive summary."
-        )
-        
-        # This will automatically use local LLaMA due to should_use_local_model check
-        response = stream_llama_response(prompt)
+        path = spooled_path(file, request)
+        document_hash = file_sha256(path)
+        # A file seen before skips extraction and summarization entirely
+        result = load_processed_document(document_hash)
+        if result is None:
+            text = extract_text_from_pdf(path)
+            if not text:
+                return jsonify({"error": "Failed to extract text from the file."}), 400
+            result = process_document(file.filename, text, document_hash, verified=True)
 
-        # Split the text into lines and get the first line as the query
-        lines = text.split('\n')
-        query = lines[0].strip()
-        remaining_text = '\n'.join(lines[1:])
+        return jsonify({
+            "message": f"File '{file.filename}' uploaded successfully.",
+            "file_id": result["file_id"],
+            "query": result["query"],
+            "response": result["response"]
+        }), 200
 
-        file_id = str(uuid.uuid4())
-        file_path = os.path.join(UPLOAD_FOLDER, f"{file_id}.txt")
+    except Exception as e:
+        logger.error(f"Error processing file: {e}")
+        return jsonify({"error": f"Error processing file: {str(e)}"}), 500
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(remaining_text)
+@app.route("/ingest_text", methods=["POST"])
+def ingest_text():
+    """Ingest text the client already extracted (pdf.js / Tesseract.js).
+
+    Body (JSON, or multipart with a "metadata" JSON field plus an optional "file"):
+        filename: original file name
+        document_hash: SHA-256 hex digest of the original file
+        pages: [{"page": 1, "text": "..."}, {"page": 2, "missing": true}, ...]
+    Only pages marked missing are OCR'd on the server, which requires the file.
+    """
+    if request.mimetype == "multipart/form-data":
+        try:
+            data = json.loads(request.form.get("metadata", "{}"))
+        except ValueError:
+            return jsonify({"error": "Invalid metadata JSON."}), 400
+        file = request.files.get("file")
+    else:
+        data = request.get_json(silent=True) or {}
+        file = None
+
+    filename = str(data.get("filename", "")).strip() or "document"
+    document_hash = str(data.get("document_hash", "")).lower()
+    pages = data.get("pages")
+    if not SHA256_PATTERN.match(document_hash):
+        return jsonify({"error": "document_hash must be a SHA-256 hex digest."}), 400
+    if not isinstance(pages, list) or not pages:
+        return jsonify({"error": "pages must be a non-empty list."}), 400
+
+    page_texts = {}
+    missing_pages = []
+    try:
+        for entry in pages:
+            page_number = int(entry["page"])
+            if entry.get("missing") or entry.get("text") is None:
+                missing_pages.append(page_number)
+            else:
+                page_texts[page_number] = str(entry["text"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Each page needs an integer 'page' and either 'text' or 'missing'."}), 400
 
-        session["pdf_file_path"] = file_path
-        session.setdefault("chat_history", [])
+    try:
+        # Results stored under document_hash come only from server-side /upload processing
+        result = load_processed_document(document_hash)
+        if result is not None:
+            missing_pages = []
+        elif missing_pages:
+            if file is None:
+                return jsonify({
+                    "error": "Some pages need server OCR; resend with the file attached.",
+                    "missing_pages": sorted(missing_pages)
+                }), 400
+            path = spooled_path(file, request)
+            if file_sha256(path) != document_hash:
+                return jsonify({"error": "Uploaded file does not match document_hash."}), 400
+            logger.info(f"Server OCR for {len(missing_pages)} of {len(pages)} pages of {filename}")
+            page_texts.update(ocr_pdf_pages(path, sorted(missing_pages)))
+
+        if result is None:
+            text = clean_ocr_text("\n".join(strip_repeated_lines([page_texts[n] for n in sorted(page_texts)])))
+            if not text:
+                return jsonify({"error": "No text found in the provided pages."}), 400
+            # Page text comes from the client, so it is never stored under the file hash
+            result = process_document(filename, text, document_hash, verified=False)
 
         return jsonify({
-            "message": f"File '{file.filename}' uploaded successfully.",
-            "file_id": file_id,
-            "query": query,
-            "response": response
+            "message": f"File '{filename}' ingested successfully.",
+            "file_id": result["file_id"],
+            "document_hash": document_hash,
+            "ocr_pages": sorted(missing_pages),
+            "query": result["query"],
+            "response": result["response"]
         }), 200
 
     except Exception as e:
-        logger.error(f"Error processing file: {e}")
-        return jsonify({"error": f"Error processing file: {str(e)}"}), 500
+        logger.error(f"Error ingesting text: {e}")
+        return jsonify({"error": f"Error ingesting text: {str(e)}"}), 500
 
 @app.route("/query", methods=["POST"])
 def query():
@@ -331,16 +769,28 @@ def query():
         save_chat_message(session_id, "user", user_question)
         chat_history = get_chat_history(session_id)
         
-        formatted_history = "\n".join([
-            f"{msg['role'].capitalize()}: {msg['content']}" 
-            for msg in chat_history[-5:]
-        ])
-
-        prompt = (
-            "You are an AI legal assistant. Answer professionally while keeping a conversational tone.\n\n"
-            f"### Chat History:\n{formatted_history}\n\n"
-            f"### Current Question:\n{user_question}\n\n"
-        )
+        # A pasted document is cut down to the sentences relevant to the question;
+        # the "### Document Context:" header routes it to the local model
+        question, document = split_pasted_document(user_question)
+        if document:
+            prompt = build_query_prompt(
+                question or "Please analyze this legal document and provide a comprehensive summary.",
+                chat_history,
+                [presummarize(document, question or None)],
+                context_header="### Document Context:"
+            )
+        else:
+            # Curated corpus entries and the session's uploaded document first, then
+            # the most recent history, within the token budget; one encode serves both searches
+            question_embedding = encode_query(user_question)
+            prompt = build_query_prompt(
+                user_question,
+                chat_history,
+                retrieve_legal_context(user_question, query_embedding=question_embedding),
+                document_chunks=retrieve_document_context(
+                    user_question, session.get("document_key"), query_embedding=question_embedding
+                )
+            )
 
         # Get response
         response = stream_llama_response(prompt)
@@ -361,6 +811,85 @@ def query():
             "success": False
         }), 500
 
+@app.route("/query_batch", methods=["POST"])
+def query_batch():
+    """Answer many independent questions in one request.
+
+    Body: {"questions": [...], "session_id": optional, "max_parallel": optional}
+    Streams NDJSON, one line per input question in input order, each sent as
+    soon as it and every earlier question are answered. Identical questions
+    are generated once; a failing item reports its own error without
+    affecting the rest.
+    """
+    data = request.get_json(silent=True) or {}
+    questions = data.get("questions")
+    session_id = data.get("session_id") or str(uuid.uuid4())
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "questions must be a non-empty list."}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch."}), 413
+    try:
+        max_parallel = max(1, min(int(data.get("max_parallel", BATCH_MAX_PARALLEL)), BATCH_MAX_PARALLEL))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_parallel must be an integer."}), 400
+
+    questions = [str(q).strip() if q is not None else "" for q in questions]
+    unique_questions = list(dict.fromkeys(q for q in questions if q))
+
+    # One embedding call for all questions, reused for retrieval and the single ChromaDB write
+    question_embeddings = []
+    if unique_questions:
+        question_embeddings = model_embedding.encode(unique_questions).tolist()
+        save_chat_messages(session_id, [("user", q) for q in unique_questions], question_embeddings)
+
+    def answer(question: str, question_embedding) -> str:
+        # Batch items are independent, so no chat history goes into the prompt
+        prompt = build_query_prompt(question, [], retrieve_legal_context(question, query_embedding=question_embedding))
+        response = stream_llama_response(prompt, priority=PRIORITY_BULK)
+        if response.startswith("Error processing"):
+            raise RuntimeError(response)
+        return response
+
+    def generate():
+        answers = {}
+        executor = ThreadPoolExecutor(max_workers=max_parallel)
+        try:
+            futures = {
+                q: executor.submit(answer, q, embedding)
+                for q, embedding in zip(unique_questions, question_embeddings)
+            }
+            for index, question in enumerate(questions):
+                item = {"index": index, "question": question}
+                if not question:
+                    item.update({"success": False, "error": "A question is required."})
+                else:
+                    try:
+                        response = futures[question].result()
+                        answers[question] = response
+                        item.update({"success": True, "response": format_response(response)})
+                    except Exception as e:
+                        logger.error(f"Error answering batch question {index}: {e}")
+                        item.update({"success": False, "error": str(e)})
+                yield json.dumps(item) + "\n"
+        finally:
+            # On client disconnect GeneratorExit lands at the yield; don't block on
+            # or keep running the generations nobody will read
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if answers:
+            answer_texts = list(answers.values())
+            save_chat_messages(
+                session_id,
+                [("assistant", a) for a in answer_texts],
+                model_embedding.encode(answer_texts).tolist()
+            )
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/metrics/llm", methods=["GET"])
+def llm_metrics():
+    return jsonify(llm_scheduler.metrics()), 200
+
 @app.route("/chat_history/<session_id>", methods=["GET"])
 def get_session_history(session_id):
     try:
@@ -0,0 +1,305 @@
+"""Offline maintenance jobs for the ChromaDB store.
+
+Chat turns live in their own collection so they do not grow the HNSW index
+of the curated legal corpus. This module:
+
+- migrates chat entries that older versions wrote into legal_docs,
+- applies a TTL (global and per-session) and a per-session message cap,
+  deleting expired entries in batches,
+- applies a separate TTL to indexed chunks of uploaded documents,
+- compacts a collection by rebuilding it, dropping HNSW tombstones left by
+  deletions,
+- reports count, on-disk size and query latency before and after each run.
+
+Run it while the Flask app is stopped:
+    python collection_maintenance.py run --ttl-days 30 --max-per-session 200
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import statistics
+from typing import Dict, Iterator, List, Optional
+
+import chromadb
+
+logger = logging.getLogger(__name__)
+
+# Constants
+CHROMA_PATH = "./chroma_db"
+LEGAL_COLLECTION_NAME = "legal_docs"
+CHAT_COLLECTION_NAME = "chat_history"
+DOCUMENT_COLLECTION_NAME = "uploaded_docs"
+MAINTAINED_COLLECTIONS = (LEGAL_COLLECTION_NAME, CHAT_COLLECTION_NAME, DOCUMENT_COLLECTION_NAME)
+BATCH_SIZE = 500
+LATENCY_PROBES = 20
+CHAT_METADATA_KEYS = ("session_id", "question")  # written by save_chat_message / store_chat_history
+
+
+class RetentionPolicy:
+    def __init__(self, ttl_seconds: Optional[float] = None,
+                 session_ttl_seconds: Optional[Dict[str, float]] = None,
+                 max_messages_per_session: Optional[int] = None):
+        """
+        ttl_seconds: default age after which chat entries expire (None keeps forever)
+        session_ttl_seconds: per-session overrides of ttl_seconds
+        max_messages_per_session: keep only the newest N entries of each session
+        """
+        self.ttl_seconds = ttl_seconds
+        self.session_ttl_seconds = session_ttl_seconds or {}
+        self.max_messages_per_session = max_messages_per_session
+
+    def ttl_for(self, session_id: Optional[str]) -> Optional[float]:
+        return self.session_ttl_seconds.get(session_id, self.ttl_seconds)
+
+
+# Helpers
+def entry_created_at(metadata: Dict) -> float:
+    """Epoch seconds of an entry; falls back to the legacy string timestamp"""
+    if "created_at" in metadata:
+        return float(metadata["created_at"])
+    try:
+        return datetime.datetime.fromisoformat(str(metadata.get("timestamp"))).timestamp()
+    except ValueError:
+        return 0.0  # unknown age: treat as oldest
+
+def iter_batches(collection, include: List[str], where: Optional[Dict] = None,
+                 batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    offset = 0
+    while True:
+        batch = collection.get(include=include, where=where, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+def delete_in_batches(collection, ids: List[str], batch_size: int = BATCH_SIZE) -> int:
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+    return len(ids)
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# Statistics
+def collection_stats(client, collection, chroma_path: str = CHROMA_PATH,
+                     probes: int = LATENCY_PROBES) -> Dict:
+    """Entry count, store size on disk and median/p95 query latency.
+
+    Latency is measured with embeddings sampled from the collection itself so
+    no embedding model has to be loaded.
+    """
+    stats = {
+        "name": collection.name,
+        "count": collection.count(),
+        "store_bytes": directory_size(chroma_path),
+    }
+    sample = collection.get(include=["embeddings"], limit=probes)
+    embeddings = sample.get("embeddings")
+    if embeddings is not None and len(embeddings):
+        timings = []
+        for embedding in embeddings:
+            start = time.perf_counter()
+            collection.query(query_embeddings=[list(embedding)], n_results=min(5, stats["count"]))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        stats["query_ms_median"] = round(statistics.median(timings), 3)
+        stats["query_ms_p95"] = round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3)
+    return stats
+
+
+# Jobs
+def migrate_chat_entries(legal_collection, chat_collection, batch_size: int = BATCH_SIZE) -> int:
+    """Move chat entries out of the curated legal collection"""
+    include = ["embeddings", "metadatas", "documents"]
+    to_move = []
+    for batch in iter_batches(legal_collection, include, batch_size=batch_size):
+        for i, metadata in enumerate(batch["metadatas"]):
+            if metadata and any(key in metadata for key in CHAT_METADATA_KEYS):
+                metadata = dict(metadata)
+                metadata.setdefault("created_at", entry_created_at(metadata))
+                to_move.append((batch["ids"][i], batch["embeddings"][i], metadata, batch["documents"][i]))
+
+    for start in range(0, len(to_move), batch_size):
+        chunk = to_move[start:start + batch_size]
+        chat_collection.upsert(
+            ids=[entry[0] for entry in chunk],
+            embeddings=[list(entry[1]) for entry in chunk],
+            metadatas=[entry[2] for entry in chunk],
+            documents=[entry[3] or "" for entry in chunk],
+        )
+    delete_in_batches(legal_collection, [entry[0] for entry in to_move], batch_size)
+    logger.info(f"Migrated {len(to_move)} chat entries out of {legal_collection.name}")
+    return len(to_move)
+
+def apply_retention(chat_collection, policy: RetentionPolicy, now: Optional[float] = None,
+                    batch_size: int = BATCH_SIZE) -> int:
+    """Delete expired entries and trim sessions over the message cap"""
+    now = time.time() if now is None else now
+    sessions: Dict[Optional[str], List] = {}
+    for batch in iter_batches(chat_collection, ["metadatas"], batch_size=batch_size):
+        for entry_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            metadata = metadata or {}
+            sessions.setdefault(metadata.get("session_id"), []).append((entry_created_at(metadata), entry_id))
+
+    expired = []
+    for session_id, entries in sessions.items():
+        entries.sort(reverse=True)  # newest first
+        ttl = policy.ttl_for(session_id)
+        for position, (created_at, entry_id) in enumerate(entries):
+            over_cap = (policy.max_messages_per_session is not None
+                        and position >= policy.max_messages_per_session)
+            too_old = ttl is not None and now - created_at > ttl
+            if over_cap or too_old:
+                expired.append(entry_id)
+
+    delete_in_batches(chat_collection, expired, batch_size)
+    logger.info(f"Retention removed {len(expired)} entries from {chat_collection.name}")
+    return len(expired)
+
+def recover_interrupted_compaction(client, name: str) -> bool:
+    """Finish or discard a compaction that died mid-swap.
+
+    If the temporary copy exists while the original is missing or empty, the
+    run died between dropping the original and renaming the copy, so the copy
+    is the only surviving data and is renamed back. Otherwise the original is
+    intact and the copy is a leftover that can be dropped. Returns True if the
+    collection was restored from the copy.
+    """
+    temp_name = f"{name}__compact"
+    try:
+        temp = client.get_collection(name=temp_name)
+    except Exception:
+        return False
+    try:
+        original = client.get_collection(name=name)
+    except Exception:
+        original = None
+
+    if temp.count() and (original is None or original.count() == 0):
+        if original is not None:
+            client.delete_collection(name=name)  # empty placeholder from get_or_create
+        temp.modify(name=name)
+        logger.warning(f"Restored {name} from interrupted compaction ({temp.count()} entries)")
+        return True
+
+    client.delete_collection(name=temp_name)
+    logger.info(f"Dropped leftover {temp_name} from an interrupted run")
+    return False
+
+def compact_collection(client, name: str, batch_size: int = BATCH_SIZE):
+    """Rebuild a collection from its live entries to drop deleted HNSW nodes.
+
+    Copies into a temporary collection, drops the original and renames the
+    copy, so it must only run while no other process is using the store. The
+    original is only dropped once the copy holds every entry.
+    """
+    recover_interrupted_compaction(client, name)
+    source = client.get_collection(name=name)
+    temp_name = f"{name}__compact"
+    target = client.create_collection(name=temp_name, metadata=source.metadata)
+
+    copied = 0
+    for batch in iter_batches(source, ["embeddings", "metadatas", "documents"], batch_size=batch_size):
+        target.add(
+            ids=batch["ids"],
+            embeddings=[list(e) for e in batch["embeddings"]],
+            metadatas=batch["metadatas"],
+            documents=batch["documents"],
+        )
+        copied += len(batch["ids"])
+
+    expected = source.count()
+    if target.count() != copied or copied != expected:
+        client.delete_collection(name=temp_name)
+        raise RuntimeError(f"Compaction of {name} copied {target.count()} of {expected} entries; original kept")
+
+    client.delete_collection(name=name)
+    target.modify(name=name)
+    logger.info(f"Compacted {name}: {copied} entries rebuilt")
+    return client.get_collection(name=name)
+
+def run_maintenance(chroma_path: str = CHROMA_PATH, policy: Optional[RetentionPolicy] = None,
+                    migrate: bool = True, compact: bool = True,
+                    document_ttl_seconds: Optional[float] = None) -> Dict:
+    """Run migration, retention and compaction, returning before/after stats
+
+    document_ttl_seconds: age after which uploaded-document chunks expire (None keeps them)
+    """
+    client = chromadb.PersistentClient(path=chroma_path)
+    # Before get_or_create, which would otherwise shadow a half-swapped collection
+    for name in MAINTAINED_COLLECTIONS:
+        recover_interrupted_compaction(client, name)
+    legal = client.get_or_create_collection(name=LEGAL_COLLECTION_NAME)
+    chat = client.get_or_create_collection(name=CHAT_COLLECTION_NAME)
+    documents = client.get_or_create_collection(name=DOCUMENT_COLLECTION_NAME)
+
+    report = {"before": [collection_stats(client, c, chroma_path) for c in (legal, chat, documents)]}
+    if migrate:
+        report["migrated"] = migrate_chat_entries(legal, chat)
+    if policy is not None:
+        report["expired"] = apply_retention(chat, policy)
+    if document_ttl_seconds is not None:
+        # TTL only: chunks carry no session_id, so a per-session cap would not apply
+        report["documents_expired"] = apply_retention(documents, RetentionPolicy(ttl_seconds=document_ttl_seconds))
+    if compact:
+        legal = compact_collection(client, LEGAL_COLLECTION_NAME)
+        chat = compact_collection(client, CHAT_COLLECTION_NAME)
+        documents = compact_collection(client, DOCUMENT_COLLECTION_NAME)
+    report["after"] = [collection_stats(client, c, chroma_path) for c in (legal, chat, documents)]
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ChromaDB retention and compaction jobs")
+    parser.add_argument("command", choices=["stats", "run"])
+    parser.add_argument("--path", default=CHROMA_PATH, help="ChromaDB persistence directory")
+    parser.add_argument("--ttl-days", type=float, default=None, help="Expire chat entries older than this")
+    parser.add_argument("--session-ttl", action="append", default=[], metavar="SESSION=DAYS",
+                        help="Per-session TTL override; may be repeated")
+    parser.add_argument("--max-per-session", type=int, default=None, help="Keep only the newest N entries per session")
+    parser.add_argument("--document-ttl-days", type=float, default=None,
+                        help="Expire indexed chunks of uploaded documents older than this")
+    parser.add_argument("--no-migrate", action="store_true", help="Skip moving chat entries out of legal_docs")
+    parser.add_argument("--no-compact", action="store_true", help="Skip rebuilding the collections")
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        client = chromadb.PersistentClient(path=args.path)
+        stats = [collection_stats(client, client.get_or_create_collection(name=name), args.path)
+                 for name in MAINTAINED_COLLECTIONS]
+        print(json.dumps(stats, indent=2))
+        return 0
+
+    policy = None
+    if args.ttl_days is not None or args.session_ttl or args.max_per_session is not None:
+        session_ttl = {}
+        for override in args.session_ttl:
+            session_id, _, days = override.rpartition("=")
+            session_ttl[session_id] = float(days) * 86400
+        policy = RetentionPolicy(
+            ttl_seconds=args.ttl_days * 86400 if args.ttl_days is not None else None,
+            session_ttl_seconds=session_ttl,
+            max_messages_per_session=args.max_per_session,
+        )
+    document_ttl = args.document_ttl_days * 86400 if args.document_ttl_days is not None else None
+    report = run_maintenance(args.path, policy, migrate=not args.no_migrate, compact=not args.no_compact,
+                             document_ttl_seconds=document_ttl)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
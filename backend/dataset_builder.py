@@ -0,0 +1,353 @@
+"""Build a prompt-completion dataset from a whole corpus of legal PDFs.
+
+Each PDF is streamed page by page through the text_pipeline.py steps shared
+with train_and_deploy.py, so memory stays bounded by a single section, not a
+whole book. PDFs are processed in parallel worker processes, near-duplicate
+pairs are dropped with MinHash/LSH, and the output is written incrementally as
+sharded JSONL. A manifest records each input's size and mtime so unchanged
+files are skipped on re-runs.
+
+Usage:
+    python dataset_builder.py statutes/ judgments/ --output dataset/
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from text_pipeline import iter_pdf_pages, iter_sections, iter_prompt_completion_pairs
+
+logger = logging.getLogger(__name__)
+
+# Constants
+MANIFEST_FILE = "manifest.json"
+SHARD_DIR = "shards"
+SIGNATURE_DIR = "signatures"
+DEFAULT_SHARD_SIZE = 10000  # pairs per shard
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_THRESHOLD = 0.85
+SHINGLE_SIZE = 5  # words per shingle
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class MinHasher:
+    """Computes MinHash signatures over word shingles.
+
+    Shingle hashes are 32-bit and the permutation coefficients are below
+    2**31, so (a * h + b) fits in uint64 and the whole signature is computed
+    with one vectorized numpy expression.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {
+                " ".join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)
+            }
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self._shingle_hashes(text)
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME
+        return np.bitwise_and(permuted, _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures for near-duplicate lookup.
+
+    Candidates sharing any band bucket are confirmed against the estimated
+    Jaccard similarity before a pair is reported as a duplicate.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS,
+                 threshold: float = DEFAULT_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.signatures: List[np.ndarray] = []
+
+    def _band_keys(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def is_duplicate(self, signature: np.ndarray) -> bool:
+        seen = set()
+        for band, key in self._band_keys(signature):
+            for idx in self.buckets[band].get(key, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if np.mean(self.signatures[idx] == signature) >= self.threshold:
+                    return True
+        return False
+
+    def insert(self, signature: np.ndarray) -> None:
+        idx = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in self._band_keys(signature):
+            self.buckets[band].setdefault(key, []).append(idx)
+
+    def add_if_unique(self, signature: np.ndarray) -> bool:
+        if self.is_duplicate(signature):
+            return False
+        self.insert(signature)
+        return True
+
+
+class ShardWriter:
+    """Appends records to size-bounded JSONL shards, opening files lazily."""
+
+    def __init__(self, shard_dir: str, prefix: str, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.shard_dir = shard_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.paths: List[str] = []
+        self.count = 0
+        self._file = None
+        self._in_shard = 0
+
+    def write(self, record: Dict) -> None:
+        if self._file is None or self._in_shard >= self.shard_size:
+            self._roll()
+        self._file.write(json.dumps(record) + "\n")
+        self._in_shard += 1
+        self.count += 1
+
+    def _roll(self) -> None:
+        self.close()
+        path = os.path.join(self.shard_dir, f"{self.prefix}-{len(self.paths):05d}.jsonl")
+        self._file = open(path, "w", encoding="utf-8")
+        self.paths.append(path)
+        self._in_shard = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Manifest helpers
+def file_fingerprint(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_manifest(output_dir: str) -> Dict:
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+def save_manifest(output_dir: str, manifest: Dict) -> None:
+    # Write-then-rename so an interrupted run never leaves a truncated manifest
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def discover_pdfs(inputs: Iterable[str]) -> List[str]:
+    pdfs = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, files in os.walk(entry):
+                pdfs.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        elif entry.lower().endswith(".pdf"):
+            pdfs.append(entry)
+    return sorted(os.path.abspath(p) for p in pdfs)
+
+def shard_prefix(pdf_path: str) -> str:
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.splitext(os.path.basename(pdf_path))[0])
+    digest = hashlib.sha1(pdf_path.encode("utf-8")).hexdigest()[:8]
+    return f"{stem[:40]}-{digest}"
+
+
+# Worker
+def process_pdf(pdf_path: str, num_perm: int = DEFAULT_NUM_PERM) -> Tuple[str, List[Dict], np.ndarray]:
+    """Stream one PDF into pairs and compute their MinHash signatures.
+
+    Runs in a worker process; signature computation is the CPU-heavy part of
+    deduplication, so it is done here rather than in the parent.
+    """
+    hasher = MinHasher(num_perm=num_perm)
+    pairs = []
+    signatures = []
+    for pair in iter_prompt_completion_pairs(iter_sections(iter_pdf_pages(pdf_path))):
+        pairs.append(pair)
+        signatures.append(hasher.signature(pair["prompt"] + "\n" + pair["completion"]))
+    if signatures:
+        return pdf_path, pairs, np.vstack(signatures)
+    return pdf_path, pairs, np.empty((0, num_perm), dtype=np.uint32)
+
+
+def _remove_outputs(entry: Dict) -> None:
+    for path in entry.get("shards", []) + [entry.get("signatures")]:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def build_dataset(inputs: Iterable[str], output_dir: str, workers: Optional[int] = None,
+                  shard_size: int = DEFAULT_SHARD_SIZE, num_perm: int = DEFAULT_NUM_PERM,
+                  bands: int = DEFAULT_BANDS, threshold: float = DEFAULT_THRESHOLD,
+                  prune: bool = False) -> Dict:
+    """Build or incrementally update a sharded, deduplicated dataset.
+
+    Outputs of files built by earlier runs are kept even when those files are
+    not passed this time, unless prune is set; outputs of files deleted from
+    disk are always removed.
+
+    Returns a summary dict with counts of processed, skipped and failed files
+    and of pairs kept and dropped as near-duplicates.
+    """
+    shard_dir = os.path.join(output_dir, SHARD_DIR)
+    signature_dir = os.path.join(output_dir, SIGNATURE_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    os.makedirs(signature_dir, exist_ok=True)
+
+    manifest = load_manifest(output_dir)
+    if manifest.get("num_perm", num_perm) != num_perm:
+        raise ValueError("num_perm differs from the existing manifest; rebuild into a new directory")
+    manifest["num_perm"] = num_perm
+
+    pdfs = discover_pdfs(inputs)
+    lsh = LSHIndex(num_perm=num_perm, bands=bands, threshold=threshold)
+    summary = {"processed": 0, "skipped": 0, "failed": 0, "kept": 0, "duplicates": 0}
+
+    # Inputs that are new or changed since the last build get (re)processed
+    pending = []
+    for pdf_path in pdfs:
+        entry = manifest["files"].get(pdf_path)
+        if entry and entry["fingerprint"] == file_fingerprint(pdf_path):
+            summary["skipped"] += 1
+        else:
+            pending.append(pdf_path)
+
+    # Drop outputs of changed files and of files deleted from disk (or, with
+    # prune, not part of this run)
+    pending_set, pdf_set = set(pending), set(pdfs)
+    stale = {
+        pdf_path for pdf_path in manifest["files"]
+        if pdf_path in pending_set or not os.path.exists(pdf_path) or (prune and pdf_path not in pdf_set)
+    }
+    # A pair dropped as a near-duplicate survives only through the copy it
+    # matched; if any entry goes, files that lost pairs to dedup are rebuilt so
+    # those pairs are not lost with it (entries without a count are assumed to have)
+    if stale:
+        rebuild = [
+            pdf_path for pdf_path, entry in manifest["files"].items()
+            if pdf_path not in stale and entry.get("duplicates", 1) and os.path.exists(pdf_path)
+        ]
+        stale.update(rebuild)
+        pending.extend(rebuild)
+        summary["skipped"] -= len(pdf_set.intersection(rebuild))
+    for pdf_path in stale:
+        _remove_outputs(manifest["files"].pop(pdf_path))
+
+    # Everything else seeds the LSH index so new pairs are deduplicated
+    # against earlier builds too
+    for entry in manifest["files"].values():
+        signature_path = entry.get("signatures")
+        if signature_path and os.path.exists(signature_path):
+            for signature in np.load(signature_path):
+                lsh.insert(signature)
+    save_manifest(output_dir, manifest)
+
+    logger.info(f"Building dataset: {len(pending)} to process, {summary['skipped']} unchanged")
+    if not pending:
+        return summary
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_pdf, path, num_perm): path for path in pending}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                _, pairs, signatures = future.result()
+            except Exception as e:
+                logger.error(f"Error processing {pdf_path}: {e}")
+                summary["failed"] += 1
+                continue
+
+            writer = ShardWriter(shard_dir, shard_prefix(pdf_path), shard_size)
+            kept_signatures = []
+            duplicates = 0
+            try:
+                for pair, signature in zip(pairs, signatures):
+                    if lsh.add_if_unique(signature):
+                        writer.write(pair)
+                        kept_signatures.append(signature)
+                    else:
+                        duplicates += 1
+            finally:
+                writer.close()
+
+            signature_path = None
+            if kept_signatures:
+                signature_path = os.path.join(signature_dir, shard_prefix(pdf_path) + ".npy")
+                np.save(signature_path, np.vstack(kept_signatures))
+
+            # Record the file only after its shards are complete so a crash re-processes it
+            manifest["files"][pdf_path] = {
+                "fingerprint": file_fingerprint(pdf_path),
+                "pairs": writer.count,
+                "shards": writer.paths,
+                "signatures": signature_path,
+                "duplicates": duplicates,
+            }
+            save_manifest(output_dir, manifest)
+            summary["processed"] += 1
+            summary["kept"] += writer.count
+            summary["duplicates"] += duplicates
+            logger.info(f"{os.path.basename(pdf_path)}: kept {writer.count} of {len(pairs)} pairs")
+
+    logger.info(f"Dataset build complete: {summary}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build a deduplicated JSONL dataset from legal PDFs")
+    parser.add_argument("inputs", nargs="+", help="PDF files or directories to scan recursively")
+    parser.add_argument("--output", default="dataset", help="Output directory for shards and manifest")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="Pairs per shard")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated Jaccard similarity above which a pair is a duplicate")
+    parser.add_argument("--prune", action="store_true",
+                        help="Remove outputs of previously built files not among these inputs")
+    args = parser.parse_args(argv)
+
+    summary = build_dataset(args.inputs, args.output, workers=args.workers,
+                            shard_size=args.shard_size, threshold=args.threshold, prune=args.prune)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Read-only, memory-mapped snapshot of the curated corpus embeddings.
+
+`export` writes the legal_docs embeddings as one NumPy matrix (float32 or
+float16, rows L2-normalized) plus a metadata table stored as JSON lines with
+an offsets array. Workers open every file with mmap, so all processes on a
+host share a single page-cache copy and startup does not depend on loading
+Chroma's HNSW index. The snapshot supports exact top-k cosine search, used
+for small corpora and as a fallback when Chroma is unavailable.
+
+Usage:
+    python embedding_snapshot.py export --dtype float16
+    python embedding_snapshot.py bench --queries 200
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Constants
+SNAPSHOT_DIR = os.environ.get("EMBEDDING_SNAPSHOT_DIR", "embedding_snapshot")
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.jsonl"
+OFFSETS_FILE = "offsets.npy"
+MANIFEST_FILE = "manifest.json"
+SEARCH_CHUNK_ROWS = 65536  # rows scored at a time, bounds temporary memory
+
+
+class EmbeddingSnapshot:
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self._metadata_file = open(os.path.join(directory, METADATA_FILE), "rb")
+        self._metadata = np.memmap(self._metadata_file, dtype=np.uint8, mode="r") \
+            if os.path.getsize(os.path.join(directory, METADATA_FILE)) else np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def record(self, row: int) -> Dict:
+        """{"id": ..., "metadata": {...}} for a row"""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._metadata[start:end].tobytes())
+
+    def search(self, query_embedding, k: int = 5) -> List[Dict]:
+        """Exact top-k by cosine similarity"""
+        n = len(self)
+        if n == 0 or k <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        k = min(k, n)
+
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SEARCH_CHUNK_ROWS):
+            block = self.embeddings[start:start + SEARCH_CHUNK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            entry = self.record(int(row))
+            entry["score"] = float(scores[row])
+            results.append(entry)
+        return results
+
+    def close(self) -> None:
+        self._metadata_file.close()
+
+
+def load_snapshot(directory: str = SNAPSHOT_DIR) -> Optional[EmbeddingSnapshot]:
+    """Open a snapshot if one has been exported, otherwise None"""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return None
+    try:
+        snapshot = EmbeddingSnapshot(directory)
+        logger.info(f"Loaded embedding snapshot with {len(snapshot)} rows from {directory}")
+        return snapshot
+    except Exception as e:
+        logger.error(f"Error loading embedding snapshot: {e}")
+        return None
+
+
+def export_snapshot(collection, directory: str = SNAPSHOT_DIR, dtype: str = "float32",
+                    batch_size: int = 1000) -> Dict:
+    """Write the collection's embeddings and metadata as a snapshot.
+
+    Files are written to a temporary directory and swapped in at the end, so
+    running workers keep their existing mapping until they reopen.
+    """
+    from collection_maintenance import iter_batches
+
+    count = collection.count()
+    tmp_dir = directory.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    matrix = None
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    row = 0
+    with open(os.path.join(tmp_dir, METADATA_FILE), "wb") as metadata_file:
+        for batch in iter_batches(collection, ["embeddings", "metadatas"], batch_size=batch_size):
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    os.path.join(tmp_dir, EMBEDDINGS_FILE), mode="w+", dtype=dtype,
+                    shape=(count, vectors.shape[1])
+                )
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            rows = min(len(vectors), count - row)  # guard against writes during export
+            matrix[row:row + rows] = (vectors / norms)[:rows].astype(dtype)
+            for entry_id, metadata in zip(batch["ids"][:rows], batch["metadatas"][:rows]):
+                line = (json.dumps({"id": entry_id, "metadata": metadata or {}}) + "\n").encode("utf-8")
+                metadata_file.write(line)
+                offsets[row + 1] = offsets[row] + len(line)
+                row += 1
+            if row >= count:
+                break
+
+    if matrix is None:
+        matrix = np.lib.format.open_memmap(os.path.join(tmp_dir, EMBEDDINGS_FILE), mode="w+",
+                                           dtype=dtype, shape=(0, 0))
+    elif row < count:
+        logger.warning(f"Collection shrank during export; keeping {row} of {count} rows")
+    matrix.flush()
+    dimension = matrix.shape[1]
+    del matrix
+    if row < count:
+        # Trim the matrix to the rows actually written
+        trimmed = np.load(os.path.join(tmp_dir, EMBEDDINGS_FILE), mmap_mode="r")[:row].copy()
+        np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), trimmed)
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets[:row + 1])
+
+    manifest = {
+        "collection": collection.name,
+        "rows": row,
+        "dimension": dimension,
+        "dtype": dtype,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    logger.info(f"Exported {row} embeddings ({dtype}) to {directory}")
+    return manifest
+
+
+def benchmark(snapshot: EmbeddingSnapshot, collection, queries: int = 100, k: int = 5) -> Dict:
+    """Compare snapshot exact search with Chroma query latency and overlap.
+
+    Query vectors are sampled from the snapshot itself.
+    """
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(snapshot), size=min(queries, len(snapshot)), replace=False)
+    snapshot_ms, chroma_ms, overlap = [], [], []
+    for row in rows:
+        query = np.asarray(snapshot.embeddings[row], dtype=np.float32)
+
+        start = time.perf_counter()
+        exact = snapshot.search(query, k)
+        snapshot_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        approx = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        chroma_ms.append((time.perf_counter() - start) * 1000)
+
+        exact_ids = {entry["id"] for entry in exact}
+        overlap.append(len(exact_ids & set(approx["ids"][0])) / max(1, len(exact_ids)))
+
+    def summary(timings):
+        return {
+            "p50_ms": round(float(np.percentile(timings, 50)), 3),
+            "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        }
+
+    return {
+        "rows": len(snapshot),
+        "queries": len(rows),
+        "k": k,
+        "snapshot": summary(snapshot_ms),
+        "chroma": summary(chroma_ms),
+        "chroma_recall_vs_exact": round(float(np.mean(overlap)), 4),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export and benchmark the embedding snapshot")
+    parser.add_argument("command", choices=["export", "bench"])
+    parser.add_argument("--path", default="./chroma_db", help="ChromaDB persistence directory")
+    parser.add_argument("--output", default=SNAPSHOT_DIR, help="Snapshot directory")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--queries", type=int, default=100, help="Benchmark query count")
+    parser.add_argument("-k", type=int, default=5, help="Results per query")
+    args = parser.parse_args(argv)
+
+    import chromadb
+    from collection_maintenance import LEGAL_COLLECTION_NAME
+
+    client = chromadb.PersistentClient(path=args.path)
+    collection = client.get_or_create_collection(name=LEGAL_COLLECTION_NAME)
+    if args.command == "export":
+        print(json.dumps(export_snapshot(collection, args.output, args.dtype), indent=2))
+        return 0
+
+    snapshot = load_snapshot(args.output)
+    if snapshot is None or not len(snapshot):
+        print("No snapshot found; run 'export' first.")
+        return 1
+    print(json.dumps(benchmark(snapshot, collection, args.queries, args.k), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
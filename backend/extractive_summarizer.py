@@ -0,0 +1,236 @@
+"""Extractive pre-summarizer that shrinks document text before the LLM.
+
+Running page headers and footers are removed line by line while page breaks
+are still known (strip_repeated_lines, called before text cleaning).
+Documents are then split into sentences, repeated boilerplate such as stamps
+is dropped by hashing a normalized form of each sentence, and the rest are
+scored in one batched encode with the sentence-transformer
+the app already loads. Sentences are ranked by similarity to the question,
+or to the document centroid when summarizing without one, and the best are
+kept, in original order, up to a token target.
+
+Benchmark on real filings (token counts only, or end to end with --llm):
+    python extractive_summarizer.py bench uploads/*.txt --llm
+"""
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_TARGET_TOKENS = 1200
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+BOILERPLATE_MIN_REPEATS = 3  # short sentences (or header lines, in pages) seen this often are dropped entirely
+BOILERPLATE_MAX_CHARS = 200  # longer repeats are real content; keep their first copy
+HEADER_FOOTER_LINES = 3  # non-blank lines at the top and bottom of a page checked for headers
+HEADER_FOOTER_MAX_CHARS = 120
+MIN_SENTENCE_CHARS = 15
+ENCODE_BATCH_SIZE = 64
+
+# Sentence ends at . ? ! followed by whitespace and an uppercase letter, digit or "("
+# unless the period ends a common legal abbreviation
+_ABBREVIATIONS = "".join(rf"(?<!\b{a}\.)" for a in ("No", "Sec", "Art", "Cl", "vs", "v", "s", "Smt", "Sri", "Dr", "Mr", "Mrs", "Rs"))
+SENTENCE_BOUNDARY = re.compile(_ABBREVIATIONS + r"(?<=[.?!])\s+(?=[A-Z0-9(])")
+# Page counters: "Page 3", "Page 3 of 40", "3 of 40", "Page 3/40", or a bare "- 3 -"
+PAGE_COUNTER = re.compile(r"\bpage\s*\d+(?:\s*(?:of|/)\s*\d+)?\b|\b\d+\s+of\s+\d+\b|^\W*\d+\W*$", re.IGNORECASE)
+FOOTNOTE_MARKER = re.compile(r"\d+\*+\[([^\]]*)\]|\d*\*{2,}")  # e.g. 2*[India], 6****
+
+
+def strip_footnote_markers(text: str) -> str:
+    """Turn '2*[India]' into 'India' and drop bare '6****' markers"""
+    return FOOTNOTE_MARKER.sub(lambda m: m.group(1) or "", text)
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for block in re.split(r"\n\s*\n", text):
+        for sentence in SENTENCE_BOUNDARY.split(block):
+            sentence = " ".join(sentence.split())
+            if len(sentence) >= MIN_SENTENCE_CHARS:
+                sentences.append(sentence)
+    return sentences
+
+def _fingerprint(sentence: str) -> str:
+    # Digits are kept so "Section 302" and "Section 304" stay distinct
+    normalized = re.sub(r"[\W_]+", " ", sentence.lower()).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+def _header_fingerprint(line: str) -> str:
+    # Only page counters are masked, so "Page 3 of 40" matches on every page
+    # while "ARTICLE 14" and "ARTICLE 19" stay distinct
+    return re.sub(r"[\W_]+", " ", PAGE_COUNTER.sub(" page ", line.strip().lower())).strip()
+
+def strip_repeated_lines(pages: List[str], min_repeats: int = BOILERPLATE_MIN_REPEATS) -> List[str]:
+    """Drop running headers and footers from raw page texts.
+
+    A short line near the top or bottom of a page is removed when the same
+    line, ignoring page counters, is near the edge of at least min_repeats
+    pages. Lines further into the page are never touched.
+    """
+    page_lines, page_edges = [], []
+    counts = Counter()
+    for page in pages:
+        lines = page.splitlines()
+        nonblank = [i for i, line in enumerate(lines) if line.strip()]
+        edges = {}
+        for i in set(nonblank[:HEADER_FOOTER_LINES] + nonblank[-HEADER_FOOTER_LINES:]):
+            if len(lines[i].strip()) <= HEADER_FOOTER_MAX_CHARS:
+                fp = _header_fingerprint(lines[i])
+                if fp:
+                    edges[i] = fp
+        counts.update(set(edges.values()))
+        page_lines.append(lines)
+        page_edges.append(edges)
+
+    stripped = []
+    for lines, edges in zip(page_lines, page_edges):
+        stripped.append("\n".join(
+            line for i, line in enumerate(lines) if counts[edges.get(i)] < min_repeats
+        ))
+    return stripped
+
+
+class ExtractiveSummarizer:
+    def __init__(self, model, target_tokens: int = DEFAULT_TARGET_TOKENS,
+                 min_repeats: int = BOILERPLATE_MIN_REPEATS):
+        """
+        model: a loaded SentenceTransformer (the app's all-MiniLM-L6-v2)
+        target_tokens: token size of the extract passed on to the prompt
+        min_repeats: sentences repeated at least this often count as boilerplate
+        """
+        self.model = model
+        self.target_tokens = target_tokens
+        self.min_repeats = min_repeats
+
+    def summarize(self, text: str, question: Optional[str] = None,
+                  target_tokens: Optional[int] = None) -> Tuple[str, Dict]:
+        """Return (extract, stats); text already within target is returned unchanged"""
+        target = target_tokens or self.target_tokens
+        input_tokens = count_tokens(text)
+        stats = {"input_tokens": input_tokens, "output_tokens": input_tokens,
+                 "sentences": 0, "boilerplate_dropped": 0, "selected": 0}
+        if input_tokens <= target:
+            return text, stats
+
+        sentences = split_sentences(strip_footnote_markers(text))
+        stats["sentences"] = len(sentences)
+
+        # Drop boilerplate and exact repeats, keeping the first copy of rarer duplicates
+        fingerprints = [_fingerprint(s) for s in sentences]
+        counts = Counter(fingerprints)
+        seen = set()
+        candidates = []
+        for sentence, fp in zip(sentences, fingerprints):
+            boilerplate = counts[fp] >= self.min_repeats and len(sentence) <= BOILERPLATE_MAX_CHARS
+            if boilerplate or fp in seen:
+                stats["boilerplate_dropped"] += 1
+                continue
+            seen.add(fp)
+            candidates.append(sentence)
+        if not candidates:
+            return text, stats
+
+        # One batched encode for the question and every candidate sentence
+        inputs = ([question] if question else []) + candidates
+        embeddings = np.asarray(self.model.encode(
+            inputs, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True
+        ), dtype=np.float32)
+        if question:
+            anchor, sentence_embeddings = embeddings[0], embeddings[1:]
+        else:
+            sentence_embeddings = embeddings
+            anchor = sentence_embeddings.mean(axis=0)
+            anchor /= np.linalg.norm(anchor) or 1.0
+        scores = sentence_embeddings @ anchor
+
+        selected, used = [], 0
+        for index in np.argsort(-scores):
+            tokens = count_tokens(candidates[index]) + 1  # +1 for the joining space
+            if used + tokens > target:
+                continue
+            selected.append(int(index))
+            used += tokens
+        extract = " ".join(candidates[i] for i in sorted(selected))
+
+        stats.update({"output_tokens": count_tokens(extract), "selected": len(selected)})
+        return extract, stats
+
+
+def _generate(prompt: str, url: str) -> Tuple[str, float]:
+    import requests
+    start = time.perf_counter()
+    response = requests.post(url, json={"model": "llama3", "prompt": prompt, "stream": False})
+    return response.json().get("response", ""), time.perf_counter() - start
+
+def benchmark(paths: List[str], target_tokens: int = DEFAULT_TARGET_TOKENS,
+              llm_url: Optional[str] = None, model=None) -> Dict:
+    """Prompt size (and optionally local LLM latency) with and without pre-summarization.
+
+    model: an encoder with SentenceTransformer's encode(); defaults to all-MiniLM-L6-v2
+    """
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(DEFAULT_MODEL)
+
+    summarizer = ExtractiveSummarizer(model, target_tokens)
+    instruction = "Please analyze this legal document and provide a comprehensive summary."
+    results = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        start = time.perf_counter()
+        extract, stats = summarizer.summarize(text)
+        row = {"file": path, **stats, "summarize_ms": round((time.perf_counter() - start) * 1000, 1)}
+        if llm_url:
+            for label, body in (("full", text), ("extract", extract)):
+                _, seconds = _generate(f"### Document Context:\n{body}\n\n{instruction}", llm_url)
+                row[f"llm_{label}_s"] = round(seconds, 2)
+        results.append(row)
+
+    total_in = sum(r["input_tokens"] for r in results)
+    total_out = sum(r["output_tokens"] for r in results)
+    summary = {
+        "files": len(results),
+        "input_tokens": total_in,
+        "output_tokens": total_out,
+        "token_reduction": round(1 - total_out / total_in, 3) if total_in else 0.0,
+    }
+    if llm_url and results:
+        full = sum(r["llm_full_s"] for r in results)
+        extracted = sum(r["llm_extract_s"] + r["summarize_ms"] / 1000 for r in results)
+        summary.update({"llm_full_s": round(full, 2), "llm_extract_s": round(extracted, 2),
+                        "latency_reduction": round(1 - extracted / full, 3) if full else 0.0})
+    return {"summary": summary, "files": results}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark extractive pre-summarization")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("paths", nargs="+", help="Text files of extracted filings, e.g. uploads/*.txt")
+    parser.add_argument("--target-tokens", type=int, default=DEFAULT_TARGET_TOKENS)
+    parser.add_argument("--llm", action="store_true", help="Also time end-to-end generation with local llama3")
+    parser.add_argument("--llm-url", default="http://127.0.0.1:11434/api/generate")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help="Sentence-transformer name or local path (for hosts without hub access)")
+    args = parser.parse_args(argv)
+
+    from sentence_transformers import SentenceTransformer
+    report = benchmark(args.paths, args.target_tokens, args.llm_url if args.llm else None,
+                       model=SentenceTransformer(args.model))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
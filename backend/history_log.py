@@ -0,0 +1,155 @@
+"""Append-only chat history log with constant-time tail reads.
+
+Records are stored one JSON object per line in numbered, size-bounded
+segment files. A tiny index file records the first and active segment, so
+reading the last N records seeks backward from the end of the active segment
+(and at most steps into earlier segments) instead of reading the whole log.
+Appends and rotation are serialized with a thread lock plus an OS-level file
+lock, so multiple threads and worker processes can share one log.
+"""
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+INDEX_FILE = "index.json"
+LOCK_FILE = "history.lock"
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+READ_BLOCK_SIZE = 8192
+
+
+class HistoryLog:
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_segments: Optional[int] = None):
+        """
+        directory: folder holding segments, index and lock file
+        segment_bytes: size at which the active segment is rotated
+        max_segments: if set, the oldest segments beyond this count are deleted on rotation
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._thread_lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Locking
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        with self._thread_lock:
+            with open(os.path.join(self.directory, LOCK_FILE), "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                elif msvcrt is not None:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    elif msvcrt is not None:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    # Index
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:06d}.log")
+
+    def _read_index(self) -> Dict:
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"first": 0, "active": 0}
+
+    def _write_index(self, index: Dict) -> None:
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    def _rotate(self, index: Dict) -> None:
+        index["active"] += 1
+        if self.max_segments is not None:
+            while index["active"] - index["first"] + 1 > self.max_segments:
+                try:
+                    os.remove(self._segment_path(index["first"]))
+                except FileNotFoundError:
+                    pass
+                index["first"] += 1
+        self._write_index(index)
+        logger.info(f"Rotated chat history to segment {index['active']}")
+
+    # Public API
+    def append(self, record: Dict) -> None:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked(exclusive=True):
+            index = self._read_index()
+            path = self._segment_path(index["active"])
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(line) > self.segment_bytes:
+                self._rotate(index)
+                path = self._segment_path(index["active"])
+            # A single write of the whole line so a record is never split
+            with open(path, "ab") as f:
+                f.write(line)
+
+    def tail(self, n: int) -> List[Dict]:
+        """Return the last n records, oldest first"""
+        if n <= 0:
+            return []
+        with self._locked(exclusive=False):
+            index = self._read_index()
+            lines: List[bytes] = []
+            segment = index["active"]
+            while len(lines) < n and segment >= index["first"]:
+                lines = self._tail_lines(self._segment_path(segment), n - len(lines)) + lines
+                segment -= 1
+
+        records = []
+        for raw in lines[-n:]:
+            try:
+                records.append(json.loads(raw))
+            except ValueError:
+                logger.error("Skipping corrupt chat history record")
+        return records
+
+    @staticmethod
+    def _tail_lines(path: str, n: int) -> List[bytes]:
+        """Read the last n complete lines of a file by seeking backward in blocks"""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b""
+            # Need n + 1 newlines to be sure the earliest line is complete
+            while position > 0 and buffer.count(b"\n") <= n:
+                read_size = min(READ_BLOCK_SIZE, position)
+                position -= read_size
+                f.seek(position)
+                buffer = f.read(read_size) + buffer
+        pieces = buffer.split(b"\n")
+        if position > 0:
+            pieces = pieces[1:]  # first piece may be a partial line (or empty at a boundary)
+        return [line for line in pieces if line][-n:]
@@ -4,6 +4,8 @@ import uuid
 from sentence_transformers import SentenceTransformer
 import logging
 
+from collection_maintenance import LEGAL_COLLECTION_NAME
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -11,7 +13,7 @@ def initialize_database():
     try:
         # Initialize ChromaDB
         client = chromadb.PersistentClient(path="./chroma_db")
-        collection = client.get_or_create_collection(name="legal_docs")
+        collection = client.get_or_create_collection(name=LEGAL_COLLECTION_NAME)
         logger.info("ChromaDB initialized successfully.")
 
         # Load Sentence Transformer Model for embeddings
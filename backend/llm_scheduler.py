@@ -0,0 +1,190 @@
+"""Load-aware scheduler in front of the local LLaMA and Groq backends.
+
+Each backend has a priority queue and a fixed number of worker threads, so
+the local model never runs more generations at once than it can handle.
+Interactive chat is served ahead of bulk document summaries. A job that has
+waited longer than the spillover threshold may be picked up by an idle worker
+of the other backend, if the job and the scheduler policy allow it.
+Identical prompts submitted while one is already queued or running share a
+single generation.
+"""
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+WAIT_SAMPLES = 1000  # queue-wait samples kept per backend for percentiles
+
+
+class _Job:
+    __slots__ = ("key", "prompt", "backend", "priority", "seq", "allow_spillover",
+                 "enqueued_at", "claimed", "future")
+
+    def __init__(self, key, prompt, backend, priority, seq, allow_spillover):
+        self.key = key
+        self.prompt = prompt
+        self.backend = backend
+        self.priority = priority
+        self.seq = seq
+        self.allow_spillover = allow_spillover
+        self.enqueued_at = time.monotonic()
+        self.claimed = False
+        self.future = Future()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Backend:
+    def __init__(self, name: str, generate: Callable[[str], str], max_concurrency: int):
+        self.name = name
+        self.generate = generate
+        self.max_concurrency = max_concurrency
+        self.queue: List[_Job] = []
+        self.depth = 0  # unclaimed jobs in queue
+        self.in_flight = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.counters = {"completed": 0, "failed": 0, "spilled_in": 0}
+
+    def pop(self) -> Optional[_Job]:
+        while self.queue:
+            job = heapq.heappop(self.queue)
+            if not job.claimed:
+                return job
+        return None
+
+    def steal(self, now: float, threshold: float) -> Optional[_Job]:
+        """Best spillover candidate that has waited past the threshold"""
+        best = None
+        for job in self.queue:
+            if (not job.claimed and job.allow_spillover and now - job.enqueued_at >= threshold
+                    and (best is None or job < best)):
+                best = job
+        return best
+
+
+class LLMScheduler:
+    def __init__(self, backends: Dict[str, Callable[[str], str]], concurrency: Dict[str, int],
+                 spillover_after: float = 5.0, spillover_targets: Optional[Dict[str, str]] = None):
+        """
+        backends: backend name -> function generating a response for a prompt
+        concurrency: backend name -> maximum simultaneous generations
+        spillover_after: seconds a job may wait before another backend may take it
+        spillover_targets: backend name -> backend allowed to take its waiting jobs
+        """
+        self.spillover_after = spillover_after
+        self.spillover_targets = spillover_targets or {}
+        self._backends = {
+            name: _Backend(name, generate, concurrency.get(name, 1))
+            for name, generate in backends.items()
+        }
+        self._cond = threading.Condition()
+        self._in_flight: Dict[tuple, _Job] = {}
+        self._seq = itertools.count()
+        self._counters = {"submitted": 0, "coalesced": 0}
+        for backend in self._backends.values():
+            for i in range(backend.max_concurrency):
+                threading.Thread(target=self._worker, args=(backend,), daemon=True,
+                                 name=f"llm-{backend.name}-{i}").start()
+
+    def submit(self, prompt: str, backend: str, priority: int = PRIORITY_INTERACTIVE,
+               allow_spillover: bool = True) -> Future:
+        # The allowed set of backends is part of the key: a job that may not leave
+        # the local model must not be answered by a coalesced remote generation
+        key = (prompt, backend, allow_spillover)
+        with self._cond:
+            self._counters["submitted"] += 1
+            existing = self._in_flight.get(key)
+            if existing is not None:
+                self._counters["coalesced"] += 1
+                # Promote the shared job if a more urgent caller joined it
+                if priority < existing.priority and not existing.claimed:
+                    existing.claimed = True
+                    promoted = _Job(key, prompt, existing.backend, priority, next(self._seq), allow_spillover)
+                    promoted.enqueued_at = existing.enqueued_at
+                    promoted.future = existing.future
+                    heapq.heappush(self._backends[existing.backend].queue, promoted)
+                    self._in_flight[key] = promoted
+                    self._cond.notify_all()
+                return existing.future
+
+            job = _Job(key, prompt, backend, priority, next(self._seq), allow_spillover)
+            self._in_flight[key] = job
+            queue = self._backends[backend]
+            heapq.heappush(queue.queue, job)
+            queue.depth += 1
+            self._cond.notify_all()
+            return job.future
+
+    def generate(self, prompt: str, backend: str, priority: int = PRIORITY_INTERACTIVE,
+                 allow_spillover: bool = True) -> str:
+        return self.submit(prompt, backend, priority, allow_spillover).result()
+
+    def _next_job(self, backend: _Backend) -> _Job:
+        # Called with self._cond held
+        while True:
+            job = backend.pop()
+            if job is None:
+                now = time.monotonic()
+                for source in self._backends.values():
+                    if self.spillover_targets.get(source.name) == backend.name:
+                        job = source.steal(now, self.spillover_after)
+                        if job is not None:
+                            backend.counters["spilled_in"] += 1
+                            logger.info(f"Spilling job from {source.name} to {backend.name} "
+                                        f"after {now - job.enqueued_at:.2f}s")
+                            break
+            if job is not None:
+                job.claimed = True
+                self._backends[job.backend].depth -= 1
+                return job
+            # Wake periodically so waiting jobs become eligible for spillover
+            self._cond.wait(timeout=min(1.0, self.spillover_after / 2) if self.spillover_targets else None)
+
+    def _worker(self, backend: _Backend) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job(backend)
+                backend.waits.append(time.monotonic() - job.enqueued_at)
+                backend.in_flight += 1
+            try:
+                result = backend.generate(job.prompt)
+            except Exception as e:
+                logger.error(f"Error generating with {backend.name}: {e}")
+                with self._cond:
+                    backend.in_flight -= 1
+                    backend.counters["failed"] += 1
+                    self._in_flight.pop(job.key, None)
+                job.future.set_exception(e)
+                continue
+            with self._cond:
+                backend.in_flight -= 1
+                backend.counters["completed"] += 1
+                self._in_flight.pop(job.key, None)
+            job.future.set_result(result)
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            backends = {}
+            for name, backend in self._backends.items():
+                waits = sorted(backend.waits)
+                backends[name] = {
+                    "queued": backend.depth,
+                    "in_flight": backend.in_flight,
+                    "max_concurrency": backend.max_concurrency,
+                    "queue_wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    "queue_wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+                    "queue_wait_ms_max": round(waits[-1] * 1000, 1) if waits else None,
+                    **backend.counters,
+                }
+            return {**self._counters, "backends": backends}
@@ -0,0 +1,245 @@
+"""Token-budgeted prompt assembly.
+
+Sections are added in the order they should appear in the prompt, each with a
+priority. The budget is filled in priority order (lowest number first):
+whole sections when they fit, otherwise truncated (or summarized, if a
+summarizer is given) to the tokens left. List sections such as retrieved
+chunks or chat history keep as many items as fit, preferring the first or the
+most recent items, and can cap the size of any single item so one long pasted
+document cannot crowd out everything else.
+
+Tokens are counted with a tiktoken encoding loaded once per process, and
+counts of short, frequently repeated strings (history messages, headers) are
+memoized. tiktoken downloads the encoding file on first use; on hosts without
+network access, pre-populate it once and point TIKTOKEN_CACHE_DIR at it:
+
+    TIKTOKEN_CACHE_DIR=./tiktoken_cache python -c "import tiktoken; tiktoken.get_encoding('cl100k_base')"
+
+If the encoding still cannot be loaded, a conservative estimate of one token
+per FALLBACK_CHARS_PER_TOKEN characters is used instead and a warning logged.
+"""
+import os
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_ENCODING = os.environ.get("PROMPT_TOKEN_ENCODING", "cl100k_base")
+SECTION_SEPARATOR = "\n\n"
+CACHEABLE_TEXT_LENGTH = 4096  # longer strings are counted but not memoized
+TRUNCATION_MARKER = "..."
+FALLBACK_CHARS_PER_TOKEN = 3  # overestimates real BPE counts, so budgets stay safe
+
+# Priorities (lower is filled first)
+PRIORITY_SYSTEM = 0
+PRIORITY_QUESTION = 1
+PRIORITY_CONTEXT = 2
+PRIORITY_HISTORY = 3
+
+
+class _CharEstimateEncoding:
+    """Stand-in for a tiktoken encoding: every few characters count as one token"""
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        step = FALLBACK_CHARS_PER_TOKEN
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+def get_encoding(encoding_name: str = DEFAULT_ENCODING):
+    return _load_encoding(encoding_name)
+
+@lru_cache(maxsize=None)
+def _load_encoding(encoding_name: str):
+    # Keyed on the name alone, so the fallback warning is logged once per process
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding {encoding_name} ({e}); "
+                       f"estimating tokens as characters / {FALLBACK_CHARS_PER_TOKEN}. "
+                       f"Set TIKTOKEN_CACHE_DIR to a pre-populated cache to use exact counts.")
+        return _CharEstimateEncoding()
+
+@lru_cache(maxsize=8192)
+def _count_tokens_cached(text: str, encoding_name: str) -> int:
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    if not text:
+        return 0
+    if len(text) <= CACHEABLE_TEXT_LENGTH:
+        return _count_tokens_cached(text, encoding_name)
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING,
+                       from_end: bool = False) -> str:
+    """Cut text to at most max_tokens tokens, marking the cut with "...".
+
+    Only a window of the text proportional to max_tokens is encoded, so
+    truncating a very long document stays cheap.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(encoding_name)
+    marker_tokens = count_tokens(TRUNCATION_MARKER, encoding_name)
+    keep = max_tokens - marker_tokens
+    window = max_tokens * 8
+    while True:
+        piece = text[-window:] if from_end else text[:window]
+        tokens = encoding.encode(piece, disallowed_special=())
+        if len(tokens) <= max_tokens and len(piece) == len(text):
+            return text  # whole text fits
+        if len(tokens) > keep or len(piece) == len(text):
+            break
+        window *= 2
+    if keep <= 0:
+        return ""
+    if from_end:
+        return TRUNCATION_MARKER + encoding.decode(tokens[-keep:])
+    return encoding.decode(tokens[:keep]) + TRUNCATION_MARKER
+
+
+class _Section:
+    def __init__(self, name, priority, header, items, prefer_recent, max_item_tokens):
+        self.name = name
+        self.priority = priority
+        self.header = header
+        self.items = items
+        self.prefer_recent = prefer_recent
+        self.max_item_tokens = max_item_tokens
+        self.kept: List[str] = []
+        self.truncated = False
+        self.show_header = bool(header)
+        self.overflowed = False  # ran out of budget, so lower priorities get nothing
+
+
+class PromptBuilder:
+    def __init__(self, budget_tokens: int, encoding_name: str = DEFAULT_ENCODING,
+                 summarizer: Optional[Callable[[str, int], str]] = None):
+        """
+        budget_tokens: maximum tokens of the assembled prompt
+        encoding_name: tiktoken encoding used for counting
+        summarizer: optional fn(text, max_tokens) used instead of plain truncation
+        """
+        self.budget_tokens = budget_tokens
+        self.encoding_name = encoding_name
+        self.summarizer = summarizer
+        self._sections: List[_Section] = []
+
+    def add_text(self, name: str, text: str, priority: int, header: str = "") -> "PromptBuilder":
+        if text:
+            self._sections.append(_Section(name, priority, header, [text], False, None))
+        return self
+
+    def add_items(self, name: str, items: List[str], priority: int, header: str = "",
+                  prefer_recent: bool = False, max_item_tokens: Optional[int] = None) -> "PromptBuilder":
+        """
+        items: pieces joined with newlines, e.g. ranked chunks or chat messages
+        prefer_recent: keep the last items (chat history) rather than the first (ranked chunks)
+        max_item_tokens: truncate any single item longer than this
+        """
+        items = [item for item in items if item]
+        if items:
+            self._sections.append(_Section(name, priority, header, items, prefer_recent, max_item_tokens))
+        return self
+
+    def _shrink(self, text: str, max_tokens: int, from_end: bool = False) -> str:
+        if self.summarizer is not None:
+            summary = self.summarizer(text, max_tokens)
+            if count_tokens(summary, self.encoding_name) <= max_tokens:
+                return summary
+        return truncate_to_tokens(text, max_tokens, self.encoding_name, from_end)
+
+    def _fill(self, section: _Section, remaining: int) -> int:
+        """Keep as much of a section as fits in remaining tokens; returns tokens used"""
+        overhead = count_tokens(section.header + "\n", self.encoding_name) if section.header else 0
+        section.show_header = bool(section.header)
+        if remaining <= overhead:
+            # No room for the header: keep what fits of the text without it rather
+            # than leaving the space to lower-priority sections
+            section.show_header = False
+            overhead = 0
+        if remaining <= 0:
+            section.kept = []
+            section.truncated = section.overflowed = True
+            return 0
+        remaining -= overhead
+        newline = count_tokens("\n", self.encoding_name)
+
+        ordered = list(reversed(section.items)) if section.prefer_recent else list(section.items)
+        kept, used = [], 0
+        for item in ordered:
+            if section.max_item_tokens is not None and count_tokens(item, self.encoding_name) > section.max_item_tokens:
+                item = self._shrink(item, section.max_item_tokens)
+                section.truncated = True
+            cost = count_tokens(item, self.encoding_name) + (newline if kept else 0)
+            if used + cost <= remaining:
+                kept.append(item)
+                used += cost
+                continue
+            # Partially include the boundary item, then stop
+            space = remaining - used - (newline if kept else 0)
+            if space > 0:
+                partial = self._shrink(item, space, from_end=section.prefer_recent)
+                if partial:
+                    kept.append(partial)
+                    used += count_tokens(partial, self.encoding_name) + (newline if len(kept) > 1 else 0)
+            section.truncated = section.overflowed = True
+            break
+
+        section.kept = list(reversed(kept)) if section.prefer_recent else kept
+        return used + overhead if kept else 0
+
+    def _render(self) -> str:
+        parts = []
+        for section in self._sections:
+            if section.kept:
+                body = "\n".join(section.kept)
+                parts.append(f"{section.header}\n{body}" if section.show_header else body)
+        return SECTION_SEPARATOR.join(parts)
+
+    def build(self) -> Tuple[str, Dict]:
+        """Assemble the prompt and return it with a token-count report"""
+        separator = count_tokens(SECTION_SEPARATOR, self.encoding_name)
+        remaining = self.budget_tokens
+        for section in sorted(self._sections, key=lambda s: s.priority):
+            used = self._fill(section, max(0, remaining - separator))
+            if used:
+                remaining -= used + separator
+            if section.overflowed:
+                remaining = 0
+
+        # Token boundaries can merge across joins; trim the lowest priority section until exact
+        prompt = self._render()
+        total = count_tokens(prompt, self.encoding_name)
+        for section in sorted(self._sections, key=lambda s: s.priority, reverse=True):
+            if total <= self.budget_tokens:
+                break
+            while section.kept and total > self.budget_tokens:
+                overflow = total - self.budget_tokens
+                last = 0 if section.prefer_recent else -1
+                item_tokens = count_tokens(section.kept[last], self.encoding_name)
+                if item_tokens > overflow + 1:
+                    section.kept[last] = self._shrink(section.kept[last], item_tokens - overflow - 1,
+                                                      from_end=section.prefer_recent)
+                else:
+                    section.kept.pop(last)
+                section.truncated = True
+                prompt = self._render()
+                total = count_tokens(prompt, self.encoding_name)
+
+        report = {"budget_tokens": self.budget_tokens, "total_tokens": total, "sections": {}}
+        for section in self._sections:
+            report["sections"][section.name] = {
+                "tokens": count_tokens("\n".join(section.kept), self.encoding_name),
+                "items": len(section.kept),
+                "dropped": len(section.items) - len(section.kept),
+                "truncated": section.truncated,
+            }
+        return prompt, report
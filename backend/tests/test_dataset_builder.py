@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+import dataset_builder
+from dataset_builder import LSHIndex, MinHasher, build_dataset, load_manifest
+
+SHARED = "The tenant shall pay rent on the first day of every month without demand."
+ANSWER = "Rent unpaid for fifteen days allows the landlord to terminate the lease after notice."
+
+
+def _fake_pdf_pages(path):
+    # Test "PDFs" are plain text files with pages separated by form feeds
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().split("\f")
+
+
+@pytest.fixture(autouse=True)
+def text_pdfs(monkeypatch):
+    monkeypatch.setattr(dataset_builder, "iter_pdf_pages", _fake_pdf_pages)
+
+
+def _write(path, *paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+    return str(path)
+
+
+def _pairs(output_dir):
+    pairs = []
+    for entry in load_manifest(output_dir)["files"].values():
+        for shard in entry["shards"]:
+            with open(shard, "r", encoding="utf-8") as f:
+                pairs.extend(json.loads(line) for line in f)
+    return sorted((p["prompt"], p["completion"]) for p in pairs)
+
+
+def test_minhash_lsh_flags_near_duplicates_only():
+    hasher = MinHasher()
+    lsh = LSHIndex()
+    assert lsh.add_if_unique(hasher.signature(SHARED + " " + ANSWER))
+    assert not lsh.add_if_unique(hasher.signature(SHARED + " " + ANSWER + "."))
+    assert lsh.add_if_unique(hasher.signature("A completely different clause about arbitration and venue."))
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    a = _write(tmp_path / "a.pdf", SHARED, ANSWER)
+    output = str(tmp_path / "out")
+    assert build_dataset([a], output, workers=1)["processed"] == 1
+    summary = build_dataset([a], output, workers=1)
+    assert (summary["processed"], summary["skipped"]) == (0, 1)
+
+
+def test_duplicate_pair_survives_deletion_of_its_first_copy(tmp_path):
+    a = _write(tmp_path / "a.pdf", SHARED, ANSWER)
+    b = _write(tmp_path / "b.pdf", "Chapter notes on tenancy law.", SHARED, ANSWER)
+    output = str(tmp_path / "out")
+
+    build_dataset([a], output, workers=1)
+    summary = build_dataset([b], output, workers=1)
+    assert summary["duplicates"] == 1
+    assert len(_pairs(output)) == 2
+
+    os.remove(a)
+    summary = build_dataset([b], output, workers=1)
+    assert summary["processed"] == 1
+    assert (SHARED, ANSWER) in _pairs(output)
+    assert len(_pairs(output)) == 2
@@ -0,0 +1,48 @@
+from extractive_summarizer import ExtractiveSummarizer, strip_repeated_lines
+
+
+class _FakeModel:
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        return [[1.0, float(len(text) % 7)] for text in texts]
+
+
+_BODIES = [
+    "The appellant was convicted by the Sessions Court.",
+    "Learned counsel for the State opposed the appeal.",
+    "PW-3 deposed that the weapon was recovered at 11 pm.",
+    "The post-mortem report records two stab wounds.",
+    "We find no reason to interfere with the finding.",
+]
+
+
+def test_strip_repeated_lines_removes_running_headers():
+    pages = [
+        f"IN THE HIGH COURT OF DELHI AT NEW DELHI\nPage {n} of 5\n{body}\nCRL.A. 123/2020"
+        for n, body in enumerate(_BODIES, 1)
+    ]
+    assert strip_repeated_lines(pages) == _BODIES
+
+
+def test_strip_repeated_lines_ignores_lines_on_too_few_pages():
+    pages = [f"Page {n} of 2\n{body}" for n, body in enumerate(_BODIES[:2], 1)]
+    assert strip_repeated_lines(pages) == pages
+
+
+def test_strip_repeated_lines_keeps_numbered_headings():
+    headings = ["ARTICLE 14", "ARTICLE 19", "ARTICLE 21", "Section 302", "Section 304"]
+    pages = [
+        f"{heading}\n{body}\n- {n} -"
+        for n, (heading, body) in enumerate(zip(headings, _BODIES), 1)
+    ]
+    assert strip_repeated_lines(pages) == [
+        f"{heading}\n{body}" for heading, body in zip(headings, _BODIES)
+    ]
+
+
+def test_numeric_variants_are_not_boilerplate():
+    offences = [f"The accused was charged under Section {s}." for s in (302, 304, 307)]
+    filler = [f"Witness number {i} described the events of that night in detail." for i in range(200)]
+    extract, stats = ExtractiveSummarizer(_FakeModel(), target_tokens=100_000).summarize(
+        " ".join(offences + filler), target_tokens=10
+    )
+    assert stats["boilerplate_dropped"] == 0
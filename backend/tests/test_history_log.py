@@ -0,0 +1,28 @@
+import history_log
+from history_log import HistoryLog
+
+
+def _fill(log, count, **extra):
+    for i in range(count):
+        log.append({"i": i, **extra})
+
+
+def test_tail_across_rotated_segments_with_tiny_blocks(tmp_path, monkeypatch):
+    # 4-byte blocks make some backward reads start exactly on a line boundary
+    monkeypatch.setattr(history_log, "READ_BLOCK_SIZE", 4)
+    log = HistoryLog(str(tmp_path), segment_bytes=50)
+    _fill(log, 12)
+
+    for n in (1, 3, 5, 8):
+        assert [r["i"] for r in log.tail(n)] == list(range(12 - n, 12))
+    assert [r["i"] for r in log.tail(100)] == list(range(12))
+
+
+def test_tail_single_segment_with_tiny_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_log, "READ_BLOCK_SIZE", 4)
+    log = HistoryLog(str(tmp_path))
+    _fill(log, 12, p="x")
+
+    for n in (1, 3, 5):
+        assert [r["i"] for r in log.tail(n)] == list(range(12 - n, 12))
+    assert log.tail(0) == []
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, LLMScheduler
+
+TIMEOUT = 5
+
+
+class _Recorder:
+    """Backend that records prompts and blocks on "hold" prompts until released"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.started.set()
+        try:
+            if prompt.startswith("hold"):
+                assert self.release.wait(TIMEOUT)
+            else:
+                time.sleep(0.01)
+            return f"answer to {prompt}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_identical_prompts_share_one_generation():
+    local = _Recorder()
+    scheduler = LLMScheduler({"local": local}, {"local": 1})
+    first = scheduler.submit("hold same", "local")
+    assert local.started.wait(TIMEOUT)
+    second = scheduler.submit("hold same", "local")
+    local.release.set()
+    assert first.result(TIMEOUT) == second.result(TIMEOUT) == "answer to hold same"
+    assert local.calls == ["hold same"]
+    assert scheduler.metrics()["coalesced"] == 1
+
+
+def test_interactive_jobs_run_before_bulk_and_promotion_moves_a_shared_job_up():
+    local = _Recorder()
+    scheduler = LLMScheduler({"local": local}, {"local": 1})
+    blocker = scheduler.submit("hold blocker", "local")
+    assert local.started.wait(TIMEOUT)
+    bulk = [scheduler.submit(f"bulk {i}", "local", PRIORITY_BULK) for i in range(3)]
+    # An interactive caller joins the last queued bulk job
+    promoted = scheduler.submit("bulk 2", "local", PRIORITY_INTERACTIVE)
+    interactive = scheduler.submit("chat", "local", PRIORITY_INTERACTIVE)
+    local.release.set()
+    for future in [blocker, promoted, interactive] + bulk:
+        future.result(TIMEOUT)
+    assert local.calls == ["hold blocker", "bulk 2", "chat", "bulk 0", "bulk 1"]
+    assert promoted is bulk[2]
+
+
+def test_backend_concurrency_is_capped():
+    remote = _Recorder()
+    scheduler = LLMScheduler({"remote": remote}, {"remote": 2})
+    futures = [scheduler.submit(f"hold {i}", "remote") for i in range(5)]
+    _wait_for(lambda: remote.active == 2)
+    time.sleep(0.05)
+    assert remote.max_active == 2
+    assert scheduler.metrics()["backends"]["remote"]["queued"] == 3
+    remote.release.set()
+    for future in futures:
+        future.result(TIMEOUT)
+    assert remote.max_active == 2
+
+
+def test_waiting_jobs_spill_over_only_when_allowed():
+    local, remote = _Recorder(), _Recorder()
+    scheduler = LLMScheduler({"local": local, "remote": remote}, {"local": 1, "remote": 1},
+                             spillover_after=0.05, spillover_targets={"local": "remote"})
+    blocker = scheduler.submit("hold local", "local")
+    assert local.started.wait(TIMEOUT)
+    movable = scheduler.submit("summary", "local", PRIORITY_BULK)
+    pinned = scheduler.submit("private", "local", PRIORITY_BULK, allow_spillover=False)
+
+    assert movable.result(TIMEOUT) == "answer to summary"
+    assert remote.calls == ["summary"]
+    assert not pinned.done()
+    local.release.set()
+    assert pinned.result(TIMEOUT) == "answer to private"
+    blocker.result(TIMEOUT)
+    assert "private" in local.calls and "private" not in remote.calls
+    assert scheduler.metrics()["backends"]["remote"]["spilled_in"] == 1
+
+
+def test_failures_propagate_and_free_the_prompt_for_retry():
+    attempts = []
+
+    def flaky(prompt):
+        attempts.append(prompt)
+        if len(attempts) == 1:
+            raise RuntimeError("backend down")
+        return "ok"
+
+    scheduler = LLMScheduler({"local": flaky}, {"local": 1})
+    with pytest.raises(RuntimeError, match="backend down"):
+        scheduler.generate("question", "local")
+    assert scheduler.generate("question", "local") == "ok"
+    assert scheduler.metrics()["backends"]["local"]["failed"] == 1
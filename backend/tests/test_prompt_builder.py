@@ -0,0 +1,66 @@
+from prompt_builder import (
+    PRIORITY_CONTEXT, PRIORITY_HISTORY, PRIORITY_QUESTION, PRIORITY_SYSTEM, PromptBuilder,
+    count_tokens, truncate_to_tokens,
+)
+
+SYSTEM = "You are an AI legal assistant."
+QUESTION = "Can the landlord evict a tenant without notice under the Rent Control Act?"
+CHUNKS = [f"Chunk {i}: " + "the tenancy may be terminated only after statutory notice " * 6 for i in range(5)]
+HISTORY = [f"User: earlier message number {i} about security deposits and repairs" for i in range(8)]
+
+
+def _build(budget):
+    builder = PromptBuilder(budget)
+    builder.add_text("system", SYSTEM, PRIORITY_SYSTEM)
+    builder.add_items("context", CHUNKS, PRIORITY_CONTEXT, header="### Relevant Context:")
+    builder.add_items("history", HISTORY, PRIORITY_HISTORY, header="### Chat History:",
+                      prefer_recent=True, max_item_tokens=10)
+    builder.add_text("question", QUESTION, PRIORITY_QUESTION, header="### Current Question:")
+    return builder.build()
+
+
+def test_budget_is_never_exceeded():
+    for budget in range(1, 400, 3):
+        prompt, report = _build(budget)
+        assert count_tokens(prompt) <= budget
+        assert report["total_tokens"] == count_tokens(prompt)
+
+
+def test_higher_priorities_are_filled_first():
+    full, _ = _build(10_000)
+    budget = count_tokens(full) // 2
+    prompt, report = _build(budget)
+    sections = report["sections"]
+    assert SYSTEM in prompt and QUESTION in prompt
+    assert sections["context"]["items"] > 0
+    # History is the lowest priority, so it is what gets cut
+    assert sections["history"]["items"] == 0 or sections["context"]["dropped"] == 0
+
+
+def test_history_prefers_recent_messages():
+    builder = PromptBuilder(10_000)
+    builder.add_items("history", HISTORY, PRIORITY_HISTORY, prefer_recent=True)
+    full, _ = builder.build()
+    builder = PromptBuilder(count_tokens(full) // 2)
+    builder.add_items("history", HISTORY, PRIORITY_HISTORY, prefer_recent=True)
+    prompt, _ = builder.build()
+    assert prompt.endswith(HISTORY[-1])
+    assert HISTORY[0] not in prompt
+
+
+def test_question_is_kept_over_history_when_its_header_does_not_fit():
+    header = "### Current Question:"
+    builder = PromptBuilder(count_tokens(header + "\n") - 1)
+    builder.add_items("history", HISTORY[:1], PRIORITY_HISTORY)
+    builder.add_text("question", QUESTION, PRIORITY_QUESTION, header=header)
+    prompt, report = builder.build()
+    assert report["sections"]["question"]["items"] == 1
+    assert report["sections"]["history"]["items"] == 0
+    assert prompt.startswith(QUESTION[:8])
+
+
+def test_truncate_to_tokens_marks_the_cut():
+    text = " ".join(CHUNKS)
+    cut = truncate_to_tokens(text, 20)
+    assert cut.endswith("...") and count_tokens(cut) <= 20
+    assert truncate_to_tokens(QUESTION, 1000) == QUESTION
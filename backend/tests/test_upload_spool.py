@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from upload_spool import INFLIGHT_LEDGER_FILE, InFlightLimiter
+
+
+def test_cap_is_shared_between_limiters_on_one_directory(tmp_path):
+    # Each worker process builds its own limiter over the same spool directory
+    first = InFlightLimiter(100, str(tmp_path))
+    second = InFlightLimiter(100, str(tmp_path))
+    assert first.try_acquire(60)
+    assert not second.try_acquire(50)
+    assert second.in_flight == 60
+    first.release(60)
+    assert second.try_acquire(50)
+
+
+def test_reservations_of_dead_processes_are_reclaimed(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    with open(os.path.join(tmp_path, INFLIGHT_LEDGER_FILE), "w", encoding="utf-8") as f:
+        json.dump({str(dead.pid): 100}, f)
+
+    limiter = InFlightLimiter(100, str(tmp_path))
+    assert limiter.try_acquire(100)
+    assert limiter.in_flight == 100
@@ -0,0 +1,52 @@
+"""Streaming PDF-to-pairs pipeline shared by train_and_deploy.py and dataset_builder.py.
+
+Kept free of the training stack (transformers, datasets, Flask) so building a
+dataset, and every worker process it spawns, only needs pypdf.
+"""
+import re
+
+from pypdf import PdfReader
+
+HEADER_FOOTER_PATTERN = re.compile(r"Page \d+ of \d+")
+CHAPTER_PATTERN = re.compile(r"CHAPTER\s+\w+", flags=re.IGNORECASE)
+
+def iter_pdf_pages(pdf_path):
+    """Yield the text of each page, calling extract_text() once per page"""
+    reader = PdfReader(pdf_path)
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            yield page_text
+
+def iter_sections(pages):
+    """Stream sections out of an iterable of page texts.
+
+    Text is buffered only until the next "CHAPTER" heading, so a whole book
+    never has to be held in memory. A heading touching the end of the buffer
+    is held back in case it continues on the next page.
+    """
+    buffer = ""
+    for page_text in pages:
+        buffer += HEADER_FOOTER_PATTERN.sub("", page_text) + "\n"
+        start = 0
+        for match in CHAPTER_PATTERN.finditer(buffer):
+            if match.end() >= len(buffer.rstrip()):
+                break
+            section = buffer[start:match.start()].strip()
+            if section:
+                yield section
+            start = match.end()
+        buffer = buffer[start:]
+    for section in CHAPTER_PATTERN.split(buffer):
+        section = section.strip()
+        if section:
+            yield section
+
+def iter_prompt_completion_pairs(sections):
+    for section in sections:
+        paragraphs = re.split(r"\n\s*\n", section)  # Split by paragraphs
+        for i in range(len(paragraphs) - 1):
+            prompt = paragraphs[i].strip()
+            completion = paragraphs[i + 1].strip()
+            if prompt and completion:
+                yield {"prompt": prompt, "completion": completion}
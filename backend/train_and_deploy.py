@@ -1,46 +1,30 @@
-import re
 import json
 import logging
-from pypdf import PdfReader
 from transformers import AutoTokenizer, AutoModelForCausalLM, Trainer, TrainingArguments
 from datasets import Dataset, DatasetDict
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from sklearn.model_selection import train_test_split
 
+from text_pipeline import iter_pdf_pages, iter_sections, iter_prompt_completion_pairs
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Step 1: Extract text from the PDF
 def extract_text_from_pdf(pdf_path):
     logging.info("Extracting text from PDF...")
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        if page.extract_text():
-            text += page.extract_text() + "\n"
-    return text.strip()
+    return "\n".join(iter_pdf_pages(pdf_path)).strip()
 
 # Step 2: Preprocess the text
 def preprocess_text(text):
     logging.info("Preprocessing text...")
-    text = re.sub(r"Page \d+ of \d+", "", text)  # Remove headers/footers
-    sections = re.split(r"CHAPTER\s+\w+", text, flags=re.IGNORECASE)  # Split by "CHAPTER" headings
-    sections = [section.strip() for section in sections if section.strip()]
-    return sections
+    return list(iter_sections([text]))
 
 # Step 3: Create prompt-completion pairs
 def create_prompt_completion_pairs(sections):
     logging.info("Creating prompt-completion pairs...")
-    pairs = []
-    for section in sections:
-        paragraphs = re.split(r"\n\s*\n", section)  # Split by paragraphs
-        for i in range(len(paragraphs) - 1):
-            prompt = paragraphs[i].strip()
-            completion = paragraphs[i + 1].strip()
-            if prompt and completion:
-                pairs.append({"prompt": prompt, "completion": completion})
-    return pairs
+    return list(iter_prompt_completion_pairs(sections))
 
 # Step 4: Fine-tune the model
 def fine_tune_model(dataset_path, output_dir):
@@ -145,16 +129,12 @@ def main():
     pdf_path = "C:/Users/DELL/Downloads/THE-INDIAN-PENAL-CODE-1860.pdf"
     output_dir = "C:/Users/DELL/OneDrive/Desktop/chat1/backend/legal-finetuned-gpt2"
 
-    # Step 1: Extract text
-    text = extract_text_from_pdf(pdf_path)
-
-    # Step 2: Preprocess text
-    sections = preprocess_text(text)
-
-    # Step 3: Create prompt-completion pairs
-    pairs = create_prompt_completion_pairs(sections)
+    # Steps 1-3: Stream pages through preprocessing into prompt-completion pairs
+    # (use dataset_builder.py to build from many PDFs at once)
+    logging.info("Extracting text and creating prompt-completion pairs...")
+    pairs = iter_prompt_completion_pairs(iter_sections(iter_pdf_pages(pdf_path)))
 
-    # Save pairs to a JSONL file
+    # Save pairs to a JSONL file as they are produced
     dataset_path = "legal_dataset.jsonl"
     with open(dataset_path, "w", encoding="utf-8") as f:
         for pair in pairs:
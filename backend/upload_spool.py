@@ -0,0 +1,202 @@
+"""Disk-spooled uploads with per-request and global in-flight byte limits.
+
+SpoolingRequest makes Werkzeug stream every uploaded file straight into a
+named temporary file instead of holding it in memory, so the PDF can then be
+memory-mapped for parsing and handed to pdftoppm by path. InFlightLimiter
+reserves each request's declared size against a host-wide cap shared by all
+worker processes and rejects new uploads with 503 while the cap is exhausted,
+rather than letting concurrent large uploads push the workers out of memory.
+"""
+import os
+import mmap
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from flask import Request
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "verdicta_uploads"))
+COPY_CHUNK_SIZE = 1024 * 1024
+INFLIGHT_LEDGER_FILE = "inflight.json"
+INFLIGHT_LOCK_FILE = "inflight.lock"
+
+
+class SpoolingRequest(Request):
+    """Request whose uploaded files are always spooled to named temp files"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spooled_paths: List[str] = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        # delete=False so the file can be reopened by path (required on Windows);
+        # close() removes it when the request ends
+        spool = tempfile.NamedTemporaryFile("wb+", dir=SPOOL_DIR, suffix=".upload", delete=False)
+        self.spooled_paths.append(spool.name)
+        return spool
+
+    def close(self) -> None:
+        # Flask calls close() when the request context is popped; super() closes
+        # the file streams first, so removal also works on Windows
+        try:
+            super().close()
+        finally:
+            cleanup_spooled_files(self)
+
+
+def spooled_path(file_storage, request_obj) -> str:
+    """Path of the on-disk copy of an uploaded file, spooling it if needed"""
+    name = getattr(file_storage.stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        file_storage.stream.flush()
+        return name
+    # Fallback for streams not created by SpoolingRequest: copy in chunks
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=SPOOL_DIR, suffix=".upload", delete=False) as spool:
+        file_storage.stream.seek(0)
+        while True:
+            chunk = file_storage.stream.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+    if hasattr(request_obj, "spooled_paths"):
+        request_obj.spooled_paths.append(spool.name)
+    return spool.name
+
+
+def cleanup_spooled_files(request_obj) -> None:
+    for path in getattr(request_obj, "spooled_paths", []):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing spooled upload {path}: {e}")
+    if hasattr(request_obj, "spooled_paths"):
+        request_obj.spooled_paths = []
+
+
+@contextmanager
+def open_mmap(path: str) -> Iterator[mmap.mmap]:
+    """Read-only memory map of a file; the OS pages it in on demand"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Uploaded file is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True  # no safe probe without extra dependencies; entries are released normally
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class InFlightLimiter:
+    """Upload bytes in flight, capped across every worker process on the host.
+
+    Reservations are kept per process id in a small JSON ledger in the spool
+    directory, read and rewritten under an OS-level file lock (as in
+    history_log.py), so N workers share one cap instead of each getting
+    their own. Reservations of processes that died without releasing are
+    reclaimed on the next acquire.
+    """
+
+    def __init__(self, max_bytes: int, directory: str = SPOOL_DIR):
+        """
+        max_bytes: total upload bytes allowed in flight across all requests and workers
+        directory: folder holding the shared ledger; all workers must use the same one
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._thread_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            with open(os.path.join(self.directory, INFLIGHT_LOCK_FILE), "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    elif msvcrt is not None:
+                        lock_file.seek(0)
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_ledger(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.directory, INFLIGHT_LEDGER_FILE), "r", encoding="utf-8") as f:
+                return {pid: int(nbytes) for pid, nbytes in json.load(f).items()}
+        except (FileNotFoundError, ValueError, AttributeError):
+            return {}
+
+    def _write_ledger(self, ledger: Dict[str, int]) -> None:
+        path = os.path.join(self.directory, INFLIGHT_LEDGER_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({pid: nbytes for pid, nbytes in ledger.items() if nbytes > 0}, f)
+        os.replace(tmp_path, path)
+
+    @property
+    def in_flight(self) -> int:
+        with self._locked():
+            return sum(self._read_ledger().values())
+
+    def try_acquire(self, nbytes: int) -> bool:
+        pid = str(os.getpid())
+        with self._locked():
+            ledger = {p: n for p, n in self._read_ledger().items() if p == pid or _process_alive(int(p))}
+            if sum(ledger.values()) + nbytes > self.max_bytes:
+                self._write_ledger(ledger)
+                return False
+            ledger[pid] = ledger.get(pid, 0) + nbytes
+            self._write_ledger(ledger)
+            return True
+
+    def release(self, nbytes: int) -> None:
+        pid = str(os.getpid())
+        with self._locked():
+            ledger = self._read_ledger()
+            ledger[pid] = max(0, ledger.get(pid, 0) - nbytes)
+            self._write_ledger(ledger)